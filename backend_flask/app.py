@@ -30,8 +30,21 @@ from routes.owners import owners_bp
 from routes.files import files_bp
 from routes.events import events_bp
 from routes.status import status_bp
+from routes.uploads import uploads_bp
+from db import init_app as init_db, get_pool_stats, PoolTimeoutError
+from sse_manager import sse_manager
+from event_dispatcher import event_dispatcher
+from auth_utils import bcrypt_pool, token_cache, PasswordHasherBusyError
+from revocation import revocation_list
+from google_tokens import google_token_verifier
+from http_client import http_client
+from oauth_store import oauth_store
+from session_sweeper import session_sweeper
 
 app = Flask(__name__)
+init_db(app)
+# Session cleanup thread; started per worker process (a no-op once running)
+app.before_request(session_sweeper.start)
 
 @app.route("/")
 def home():
@@ -53,7 +66,9 @@ app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB
 # CORS Configuration (Security Fix #3)
 # Default to '*' for dev compatibility, but allow override via env var
 cors_origins = os.getenv('CORS_ORIGINS', '*').split(',')
-CORS(app, resources={r"/api/*": {"origins": cors_origins}})
+CORS(app, resources={r"/api/*": {"origins": cors_origins}},
+     expose_headers=['ETag', 'Accept-Ranges', 'Content-Range', 'X-File-Id', 'X-File-Name', 'X-File-Size',
+                     'X-IV-Vector', 'X-Auth-Tag', 'X-Encrypted-Symmetric-Key'])
 
 # Logging Setup
 if not os.path.exists('logs'):
@@ -87,6 +102,26 @@ def internal_error(error):
         "message": "Internal Server Error"
     }), 500
 
+@app.errorhandler(PoolTimeoutError)
+def database_busy(error):
+    app.logger.error(f"Database pool exhausted: {error}")
+    return jsonify({
+        "error": True,
+        "statusCode": 503,
+        "message": "Server busy, please retry"
+    }), 503
+
+@app.errorhandler(PasswordHasherBusyError)
+def password_hasher_busy(error):
+    app.logger.warning(f"Password hashing rejected: {error}")
+    response = jsonify({
+        "error": True,
+        "statusCode": 503,
+        "message": "Server busy, please retry"
+    })
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({
@@ -94,12 +129,28 @@ def health_check():
         "environment": os.getenv('NODE_ENV', 'development')
     })
 
+@app.route('/health/metrics', methods=['GET'])
+def health_metrics():
+    return jsonify({
+        "db_pool": get_pool_stats(),
+        "sse": sse_manager.stats(),
+        "event_dispatcher": event_dispatcher.stats(),
+        "bcrypt": bcrypt_pool.stats(),
+        "token_cache": token_cache.stats(),
+        "revocation": revocation_list.stats(),
+        "google_id_tokens": google_token_verifier.stats(),
+        "outbound_http": http_client.stats(),
+        "oauth_sessions": oauth_store.stats(),
+        "session_sweeper": session_sweeper.stats()
+    })
+
 # Register Blueprints
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(owners_bp, url_prefix='/api/owners')
 app.register_blueprint(files_bp, url_prefix='/api')
 app.register_blueprint(events_bp, url_prefix='/api/events')
 app.register_blueprint(status_bp, url_prefix='/api/status')
+app.register_blueprint(uploads_bp, url_prefix='/api/uploads')
 
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
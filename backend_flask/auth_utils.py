@@ -2,9 +2,15 @@ import jwt
 import bcrypt
 import hashlib
 import os
+import time
+import uuid
 import datetime
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from functools import wraps
 from flask import request, jsonify, g
+from revocation import revocation_list
 
 JWT_SECRET = os.getenv('JWT_SECRET')
 if not JWT_SECRET:
@@ -12,19 +18,140 @@ if not JWT_SECRET:
     print("WARNING: Using default insecure JWT_SECRET. Set JWT_SECRET env var in production!")
     JWT_SECRET = 'default_secret_key_must_be_long'
 
+# bcrypt runs on a dedicated pool so a burst of logins cannot tie up every
+# request thread. At most BCRYPT_WORKERS hashes run at once and
+# BCRYPT_QUEUE_LIMIT more may wait; beyond that requests fail fast with 503.
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))  # Existing hashes are upgraded on next login
+BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', os.cpu_count() or 2))
+BCRYPT_QUEUE_LIMIT = int(os.getenv('BCRYPT_QUEUE_LIMIT', 32))
+BCRYPT_TIMEOUT = float(os.getenv('BCRYPT_TIMEOUT', 10))  # Seconds a request waits for its result
+
+# Verified access tokens are cached by digest so repeat requests (polling,
+# SSE reconnects) skip signature verification. An entry lives until the
+# token's exp, capped at TOKEN_CACHE_TTL; least recently used entries are
+# evicted beyond TOKEN_CACHE_SIZE. TOKEN_CACHE_SIZE=0 disables the cache.
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 10000))
+TOKEN_CACHE_TTL = float(os.getenv('TOKEN_CACHE_TTL', 3600))  # Seconds
+
+ACCESS_TOKEN_LIFETIME = datetime.timedelta(days=30)  # Extended for dev
+REFRESH_TOKEN_LIFETIME = datetime.timedelta(days=7)
+# Active sessions kept per user/owner; logging in again revokes the oldest
+MAX_SESSIONS_PER_USER = int(os.getenv('MAX_SESSIONS_PER_USER', 10))
+
+class TokenRevokedError(jwt.InvalidTokenError):
+    """The token's session has been revoked (logout, account deletion)"""
+    pass
+
+class PasswordHasherBusyError(Exception):
+    """Raised when the bcrypt pool is saturated (HTTP 503)"""
+    pass
+
+class BcryptPool:
+    """Bounded thread pool for bcrypt (the bcrypt C code releases the GIL)"""
+
+    def __init__(self, workers=BCRYPT_WORKERS, queue_limit=BCRYPT_QUEUE_LIMIT, timeout=BCRYPT_TIMEOUT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._completed = 0
+        self._rejected = 0
+        self._in_flight = 0
+        self._total_time = 0.0
+
+    def _get_executor(self):
+        # Created lazily, and again after fork (pool threads do not survive fork)
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+                    self._pid = os.getpid()
+        return self._executor
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise PasswordHasherBusyError("Password hashing is at capacity")
+        with self._lock:
+            self._in_flight += 1
+        started = time.monotonic()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._done(started)
+            raise
+        future.add_done_callback(lambda _: self._done(started))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise PasswordHasherBusyError("Password hashing timed out")
+
+    def _done(self, started):
+        with self._lock:
+            self._in_flight -= 1
+            self._completed += 1
+            self._total_time += time.monotonic() - started
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_limit': self.queue_limit,
+                'in_flight': self._in_flight,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'avg_ms': round(self._total_time / self._completed * 1000, 2) if self._completed else 0,
+                'rounds': BCRYPT_ROUNDS
+            }
+
+bcrypt_pool = BcryptPool()
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+def _checkpw(password, hashed):
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
 def hash_password(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return bcrypt_pool.run(_hashpw, password, BCRYPT_ROUNDS)
 
 def check_password(password, hashed):
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    return bcrypt_pool.run(_checkpw, password, hashed)
+
+def needs_rehash(hashed):
+    """True if a bcrypt hash was made with a cost other than BCRYPT_ROUNDS"""
+    try:
+        return int(hashed.split('$')[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError, AttributeError):
+        return False
+
+def rehash_if_needed(cursor, table, row_id, password, hashed):
+    """
+    After a successful login, upgrade a hash made with an old cost.
+    Best effort: skipped if the pool is busy. Caller commits.
+    """
+    if not needs_rehash(hashed):
+        return False
+    try:
+        new_hash = hash_password(password)
+    except PasswordHasherBusyError:
+        return False
+    cursor.execute(f"UPDATE {table} SET password_hash = ? WHERE id = ?", (new_hash, row_id))
+    return True
 
 def generate_tokens(user_id, phone, role):
     payload = {
         'sub': str(user_id),
         'phone': phone,
         'role': role,
+        'jti': uuid.uuid4().hex,  # Unique per session, so revoking one never hits another
         'iat': datetime.datetime.utcnow(),
-        'exp': datetime.datetime.utcnow() + datetime.timedelta(days=30) # Access token 30 days (extended for dev)
+        'exp': datetime.datetime.utcnow() + ACCESS_TOKEN_LIFETIME
     }
     access_token = jwt.encode(payload, JWT_SECRET, algorithm='HS256')
     
@@ -32,8 +159,10 @@ def generate_tokens(user_id, phone, role):
         'sub': str(user_id),
         'phone': phone,
         'role': role,
+        'typ': 'refresh',  # Rejected by verify_token; only /refresh accepts it
+        'jti': uuid.uuid4().hex,
         'iat': datetime.datetime.utcnow(),
-        'exp': datetime.datetime.utcnow() + datetime.timedelta(days=7) # Refresh token 7 days
+        'exp': datetime.datetime.utcnow() + REFRESH_TOKEN_LIFETIME
     }
     refresh_token = jwt.encode(refresh_payload, JWT_SECRET, algorithm='HS256')
     
@@ -42,6 +171,186 @@ def generate_tokens(user_id, phone, role):
 def hash_token(token):
     return hashlib.sha256(token.encode('utf-8')).hexdigest()
 
+class TokenCache:
+    """
+    Thread-safe LRU of verified token claims keyed by hash_token(token).
+    Only successfully verified tokens are stored, so a hit is as good as a
+    fresh jwt.decode until the entry expires or is invalidated.
+    """
+
+    def __init__(self, max_size=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()  # digest -> (expires_at, claims)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def get(self, digest):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self._misses += 1
+                return None
+            if entry[0] <= time.time():
+                # Expired: fall through to jwt.decode, which reports it
+                del self._entries[digest]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self._hits += 1
+            return entry[1]
+
+    def put(self, digest, claims):
+        if self.max_size <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        if isinstance(claims.get('exp'), (int, float)):
+            expires_at = min(expires_at, claims['exp'])
+        with self._lock:
+            self._entries[digest] = (expires_at, claims)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, *digests):
+        """Forget revoked tokens (by hash_token digest)"""
+        with self._lock:
+            for digest in digests:
+                if self._entries.pop(digest, None) is not None:
+                    self._invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0,
+                'evictions': self._evictions,
+                'invalidations': self._invalidations
+            }
+
+# Global instance
+token_cache = TokenCache()
+
+def record_revocations(cursor, token_hashes):
+    """Add access tokens to revoked_tokens. Caller commits, then calls apply_revocations()."""
+    # Tokens are not tied to their session row's expiry; keep them listed for a full token lifetime
+    expires_at = int(time.time() + ACCESS_TOKEN_LIFETIME.total_seconds())
+    for token_hash in token_hashes:
+        cursor.execute(
+            "INSERT INTO revoked_tokens (token_hash, expires_at) VALUES (?, ?)",
+            (token_hash, expires_at)
+        )
+    return [(token_hash, expires_at) for token_hash in token_hashes]
+
+def revoke_sessions(cursor, where_sql, params):
+    """
+    Invalidate the sessions matching a WHERE clause and add their access
+    tokens to revoked_tokens. Caller commits, then calls apply_revocations()
+    so this worker rejects them immediately.
+    """
+    cursor.execute(f"SELECT token_hash FROM sessions WHERE is_valid = 1 AND {where_sql}", params)
+    token_hashes = [row[0] for row in cursor.fetchall()]
+    if not token_hashes:
+        return []
+    cursor.execute(f"UPDATE sessions SET is_valid = 0 WHERE is_valid = 1 AND {where_sql}", params)
+    return record_revocations(cursor, token_hashes)
+
+def create_session(cursor, user_id, access_token, refresh_token):
+    """
+    Store a sessions row for a newly issued token pair and revoke the user's
+    oldest sessions beyond MAX_SESSIONS_PER_USER. Caller commits, then calls
+    apply_revocations() with the result.
+    """
+    now = datetime.datetime.utcnow()
+    refresh_expires_at = now + REFRESH_TOKEN_LIFETIME
+    # The row must outlive both tokens: revoke_sessions finds access tokens
+    # through it, and the session sweeper deletes it once expires_at passes
+    expires_at = now + max(ACCESS_TOKEN_LIFETIME, REFRESH_TOKEN_LIFETIME)
+    cursor.execute(
+        """INSERT INTO sessions (id, user_id, token_hash, refresh_token_hash, expires_at, refresh_expires_at, is_valid)
+           VALUES (?, ?, ?, ?, ?, ?, 1)""",
+        (str(uuid.uuid4()), user_id, hash_token(access_token), hash_token(refresh_token), expires_at, refresh_expires_at)
+    )
+    if MAX_SESSIONS_PER_USER <= 0:
+        return []
+    # Newest first: later sessions expire later (idx_sessions_user_id narrows the scan)
+    cursor.execute(
+        "SELECT id FROM sessions WHERE user_id = ? AND is_valid = 1 ORDER BY expires_at DESC",
+        (user_id,)
+    )
+    excess = [row[0] for row in cursor.fetchall()[MAX_SESSIONS_PER_USER:]]
+    if not excess:
+        return []
+    placeholders = ', '.join('?' * len(excess))
+    return revoke_sessions(cursor, f"id IN ({placeholders})", tuple(excess))
+
+def rotate_refresh_token(cursor, refresh_token, role):
+    """
+    Exchange a refresh token for a new token pair: the old session is
+    invalidated (its access token revoked) and a new one stored, all in the
+    caller's transaction. Returns (access_token, refresh_token, revoked), or
+    None if the refresh token is invalid, expired, already used or revoked.
+    """
+    try:
+        claims = jwt.decode(refresh_token, JWT_SECRET, algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        return None
+    if claims.get('role') != role:
+        return None
+
+    cursor.execute(
+        "SELECT id, user_id, token_hash FROM sessions WHERE refresh_token_hash = ? AND is_valid = 1",
+        (hash_token(refresh_token),)
+    )
+    session = cursor.fetchone()
+    if not session or session[1] != claims['sub']:
+        return None
+    # Claim the session; a concurrent refresh with the same token updates nothing
+    cursor.execute("UPDATE sessions SET is_valid = 0 WHERE id = ? AND is_valid = 1", (session[0],))
+    if cursor.rowcount != 1:
+        return None
+    revoked = record_revocations(cursor, [session[2]])
+
+    access_token, new_refresh_token = generate_tokens(claims['sub'], claims.get('phone'), role)
+    revoked += create_session(cursor, claims['sub'], access_token, new_refresh_token)
+    return access_token, new_refresh_token, revoked
+
+def apply_revocations(revoked):
+    """After commit: reject revoked tokens in this worker right away"""
+    revocation_list.add(revoked)
+    token_cache.invalidate(*(token_hash for token_hash, _ in revoked))
+
+def verify_token(token):
+    """
+    Decode and verify an access token. Returns its claims; raises
+    jwt.ExpiredSignatureError / jwt.InvalidTokenError (TokenRevokedError
+    for revoked sessions).
+    """
+    digest = hash_token(token)
+    if revocation_list.is_revoked(digest):
+        raise TokenRevokedError("Token has been revoked")
+    claims = token_cache.get(digest)
+    if claims is None:
+        claims = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        if claims.get('typ') == 'refresh':
+            raise jwt.InvalidTokenError("Refresh tokens cannot be used for API access")
+        token_cache.put(digest, claims)
+    # Callers get their own copy; the cached claims stay untouched
+    return dict(claims)
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -55,10 +364,13 @@ def token_required(f):
             return jsonify({'error': True, 'message': 'Token is missing'}), 401
         
         try:
-            data = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+            data = verify_token(token)
             g.user = data
+            g.token_hash = hash_token(token)
         except jwt.ExpiredSignatureError:
             return jsonify({'error': True, 'message': 'Token has expired'}), 401
+        except TokenRevokedError:
+            return jsonify({'error': True, 'message': 'Token has been revoked'}), 401
         except jwt.InvalidTokenError:
             return jsonify({'error': True, 'message': 'Invalid token'}), 401
         
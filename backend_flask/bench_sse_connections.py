@@ -0,0 +1,133 @@
+"""
+Benchmark: concurrent event streams held by one sse_server.py process.
+
+Starts sse_server.py with a throwaway sqlite broker log, opens N streams,
+publishes one event to every stream through the broker (as a Flask worker
+would), and reports connections held, server memory/threads and fan-out latency.
+
+Usage:
+    python bench_sse_connections.py --connections 5000 --owners 50
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+from auth_utils import generate_tokens
+from sse_broker import SQLiteEventLogBroker
+from sse_server import raise_fd_limit
+
+
+def read_proc_status(pid):
+    stats = {}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('VmRSS', 'Threads'):
+                    stats[key] = value.strip()
+    except OSError:
+        pass
+    return stats
+
+
+async def open_stream(host, port, token):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write((f"GET /api/events/stream HTTP/1.1\r\nHost: {host}\r\n"
+                  f"Authorization: Bearer {token}\r\nAccept: text/event-stream\r\n\r\n").encode())
+    await writer.drain()
+    status = await reader.readline()
+    if b' 200 ' not in status:
+        raise RuntimeError(status.decode().strip())
+    # Headers, then the 'connected' event
+    while await reader.readline() not in (b'\r\n', b''):
+        pass
+    await reader.readuntil(b'\n\n')
+    return reader, writer
+
+
+async def wait_for_event(reader, marker):
+    while True:
+        chunk = await reader.readuntil(b'\n\n')
+        if marker in chunk:
+            return time.perf_counter()
+
+
+async def open_streams(args, tokens):
+    host, port = '127.0.0.1', args.port
+    streams = []
+    start = time.perf_counter()
+    for batch_start in range(0, args.connections, args.batch):
+        batch = range(batch_start, min(batch_start + args.batch, args.connections))
+        results = await asyncio.gather(*(open_stream(host, port, tokens[i % args.owners]) for i in batch),
+                                       return_exceptions=True)
+        for i, result in zip(batch, results):
+            if isinstance(result, Exception):
+                print(f"Connection {i} failed: {result}")
+            else:
+                streams.append(result)
+    return streams, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--owners', type=int, default=10, help='Distinct owners the streams are spread over')
+    parser.add_argument('--batch', type=int, default=200, help='Connections opened concurrently')
+    parser.add_argument('--port', type=int, default=5099)
+    args = parser.parse_args()
+
+    print(f"Client open file limit: {raise_fd_limit()}")
+    log_path = os.path.join(tempfile.mkdtemp(), 'bench_events.sqlite')
+    env = dict(os.environ, SSE_BROKER='sqlite', SSE_BROKER_DB=log_path, SSE_PORT=str(args.port),
+               SSE_HOST='127.0.0.1', SSE_MAX_CONNECTIONS=str(args.connections + 10),
+               SSE_BROKER_POLL_INTERVAL='0.02')
+    server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sse_server.py')],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        time.sleep(1.5)
+        baseline = read_proc_status(server.pid)
+
+        owners = [str(uuid.uuid4()) for _ in range(args.owners)]
+        tokens = [generate_tokens(owner_id, None, 'owner')[0] for owner_id in owners]
+
+        async def scenario():
+            streams, connect_time = await open_streams(args, tokens)
+            held = read_proc_status(server.pid)
+
+            # Publish through the shared log exactly as a Flask worker does
+            publisher = SQLiteEventLogBroker(log_path)
+            marker = uuid.uuid4().hex.encode()
+            waits = [asyncio.ensure_future(wait_for_event(reader, marker)) for reader, _ in streams]
+            published = time.perf_counter()
+            for owner_id in owners:
+                publisher.publish(owner_id, 'bench', {'marker': marker.decode()})
+            done, pending = await asyncio.wait(waits, timeout=30)
+            latencies = sorted(f.result() - published for f in done if not f.exception())
+            for f in pending:
+                f.cancel()
+            for _, writer in streams:
+                writer.close()
+            return streams, connect_time, held, latencies
+
+        streams, connect_time, held, latencies = asyncio.run(scenario())
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"Connections held:   {len(streams)} / {args.connections} (opened in {connect_time:.2f}s)")
+    print(f"Server RSS:         {baseline.get('VmRSS', '?')} idle -> {held.get('VmRSS', '?')} with streams")
+    print(f"Server threads:     {baseline.get('Threads', '?')} idle -> {held.get('Threads', '?')} with streams")
+    if latencies:
+        pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+        print(f"Fan-out delivered:  {len(latencies)} / {len(streams)}")
+        print(f"Fan-out latency:    p50 {pct(0.5):.1f}ms  p99 {pct(0.99):.1f}ms  max {latencies[-1] * 1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+import os
+import hashlib
+import tempfile
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Blob Store Configuration
+BLOB_STORE = os.getenv('BLOB_STORE', 'filesystem')
+BLOB_STORE_DIR = os.getenv('BLOB_STORE_DIR', 'blob_store')
+BLOB_STORE_PATH = os.path.join(os.path.dirname(__file__), BLOB_STORE_DIR)
+DEFAULT_BUFFER_SIZE = 64 * 1024
+
+
+class BlobNotFoundError(Exception):
+    """Raised when a blob reference does not resolve to stored ciphertext"""
+    pass
+
+
+class BlobTooLargeError(Exception):
+    """Raised by a BlobWriter when more than max_bytes are written"""
+    pass
+
+
+class BlobWriter:
+    """
+    Write-only sink for one blob. Data is hashed, counted and spooled to a temp
+    file as it arrives, so memory use is bounded by buffer_size regardless of
+    blob size. Call commit() to publish the blob or discard() to drop it.
+    """
+
+    def __init__(self, tmp_dir, publish, max_bytes=None, buffer_size=DEFAULT_BUFFER_SIZE):
+        fd, self.tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        self._file = os.fdopen(fd, 'w+b', buffering=buffer_size)
+        self._publish = publish
+        self._hash = hashlib.sha256()
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.ref = None
+        self.closed = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            raise BlobTooLargeError(f"Blob exceeds {self.max_bytes} bytes")
+        self._hash.update(data)
+        self._file.write(data)
+        return len(data)
+
+    # File-like methods so the writer can back a werkzeug FileStorage
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        # Closing the FileStorage must not drop a blob that has not been committed yet
+        pass
+
+    @property
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def commit(self):
+        """Publish the blob under its SHA-256 and return the reference"""
+        if self.ref:
+            return self.ref
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self.closed = True
+        self.ref = self._hash.hexdigest()
+        self._publish(self.tmp_path, self.ref)
+        return self.ref
+
+    def discard(self):
+        """Drop the temp file. No-op after commit()."""
+        if self.ref:
+            return
+        if not self.closed:
+            self._file.close()
+            self.closed = True
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class BlobStore:
+    """
+    Storage for encrypted file bodies, addressed by the SHA-256 of the ciphertext.
+    The `files` table keeps only the hex digest (`blob_ref`).
+    """
+
+    def writer(self, max_bytes=None, buffer_size=DEFAULT_BUFFER_SIZE):
+        """Return a BlobWriter for streaming a blob into the store"""
+        raise NotImplementedError
+
+    def put(self, data):
+        """Store bytes and return their reference"""
+        writer = self.writer()
+        try:
+            writer.write(data)
+            return writer.commit()
+        finally:
+            writer.discard()
+
+    def staging_path(self, upload_id):
+        """Local path where a resumable upload accumulates its chunks"""
+        raise NotImplementedError
+
+    def commit_staged(self, path, buffer_size=DEFAULT_BUFFER_SIZE):
+        """Move a fully received staging file into the store. Returns (ref, size)."""
+        raise NotImplementedError
+
+    def open(self, ref):
+        """Return a binary file object for reading a blob"""
+        raise NotImplementedError
+
+    def delete(self, ref):
+        """Remove a blob. Missing blobs are ignored."""
+        raise NotImplementedError
+
+    def exists(self, ref):
+        raise NotImplementedError
+
+    def read(self, ref):
+        with self.open(ref) as f:
+            return f.read()
+
+    def local_path(self, ref):
+        """Filesystem path of a blob, or None if the store is not disk-backed"""
+        return None
+
+
+class FileSystemBlobStore(BlobStore):
+    """Sharded on-disk store: <root>/ab/cd/abcd...<64 hex chars>"""
+
+    def __init__(self, root):
+        self.root = root
+        self.tmp_dir = os.path.join(root, 'tmp')
+        self.staging_dir = os.path.join(root, 'uploads')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+    def _path(self, ref):
+        if not ref or len(ref) != 64 or any(c not in '0123456789abcdef' for c in ref):
+            raise BlobNotFoundError(f"Invalid blob reference: {ref!r}")
+        return os.path.join(self.root, ref[0:2], ref[2:4], ref)
+
+    def writer(self, max_bytes=None, buffer_size=DEFAULT_BUFFER_SIZE):
+        return BlobWriter(self.tmp_dir, self._publish, max_bytes=max_bytes, buffer_size=buffer_size)
+
+    def _publish(self, tmp_path, ref):
+        """Atomically move a fully written temp file to its final location"""
+        path = self._path(ref)
+        if os.path.exists(path):
+            # Same ciphertext already stored; content addressing makes this a no-op
+            os.remove(tmp_path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+
+    def staging_path(self, upload_id):
+        return os.path.join(self.staging_dir, f"{upload_id}.part")
+
+    def commit_staged(self, path, buffer_size=DEFAULT_BUFFER_SIZE):
+        # Hash in place and rename, so finalizing never copies the ciphertext
+        digest = hashlib.sha256()
+        size = 0
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(buffer_size), b''):
+                digest.update(chunk)
+                size += len(chunk)
+            os.fsync(f.fileno())
+        ref = digest.hexdigest()
+        self._publish(path, ref)
+        return ref, size
+
+    def open(self, ref):
+        try:
+            return open(self._path(ref), 'rb')
+        except FileNotFoundError:
+            raise BlobNotFoundError(f"Blob not found: {ref}")
+
+    def delete(self, ref):
+        try:
+            os.remove(self._path(ref))
+        except (FileNotFoundError, BlobNotFoundError):
+            pass
+
+    def exists(self, ref):
+        try:
+            return os.path.exists(self._path(ref))
+        except BlobNotFoundError:
+            return False
+
+    def local_path(self, ref):
+        return self._path(ref)
+
+
+# Available backends, selected with BLOB_STORE
+BLOB_STORE_BACKENDS = {
+    'filesystem': lambda: FileSystemBlobStore(BLOB_STORE_PATH),
+}
+
+
+def create_blob_store(name=BLOB_STORE):
+    if name not in BLOB_STORE_BACKENDS:
+        raise ValueError(f"Unknown BLOB_STORE '{name}'. Options: {', '.join(BLOB_STORE_BACKENDS)}")
+    return BLOB_STORE_BACKENDS[name]()
+
+
+def release_blobs(cursor, refs):
+    """
+    Free blobs whose last `files` row has been deleted.
+    Call after the DELETE has been committed; refs still referenced elsewhere are kept.
+    """
+    freed = 0
+    for ref in set(r for r in refs if r):
+        cursor.execute("SELECT 1 FROM files WHERE blob_ref = ? LIMIT 1", (ref,))
+        if cursor.fetchone():
+            continue
+        try:
+            blob_store.delete(ref)
+            freed += 1
+        except Exception as e:
+            logger.error(f"Failed to free blob {ref}: {e}")
+    return freed
+
+
+# Global instance
+blob_store = create_blob_store()
@@ -0,0 +1,203 @@
+"""
+PostgreSQL backend for db.py (DB_BACKEND=postgres).
+
+Route modules are written against sqlite3: '?' placeholders, int-indexed
+rows and timestamps that read back as ISO strings. The wrappers here give a
+psycopg connection the same surface, so routes run unchanged on either backend.
+"""
+
+import datetime
+import functools
+import os
+import threading
+
+try:
+    import psycopg
+    from psycopg.pq import TransactionStatus
+    from psycopg_pool import ConnectionPool, PoolTimeout
+except ImportError:  # Only required when DB_BACKEND=postgres
+    psycopg = None
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), 'schema_postgres.sql')
+
+# SQLite column declarations that need a different PostgreSQL type
+TYPE_MAP = {
+    'BLOB': 'BYTEA',
+    'BOOLEAN': 'INTEGER',
+}
+
+
+@functools.lru_cache(maxsize=1024)
+def translate_placeholders(sql):
+    """
+    Convert sqlite '?' placeholders to psycopg '%s'.
+    '?' inside string literals is left alone; literal '%' is doubled because
+    psycopg treats it as a placeholder prefix whenever parameters are passed.
+    """
+    out = []
+    in_literal = False
+    for ch in sql:
+        if ch == "'":
+            in_literal = not in_literal
+            out.append(ch)
+        elif ch == '%':
+            out.append('%%')
+        elif ch == '?' and not in_literal:
+            out.append('%s')
+        else:
+            out.append(ch)
+    return ''.join(out)
+
+
+def _convert_row(row):
+    if row is None:
+        return None
+    # SQLite hands back timestamps exactly as stored (ISO strings)
+    return tuple(v.isoformat() if isinstance(v, datetime.datetime) else v for v in row)
+
+
+class PostgresCursor:
+    """sqlite3.Cursor-compatible wrapper around a psycopg cursor"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=None):
+        if params is None:
+            self._cursor.execute(sql)
+        else:
+            self._cursor.execute(translate_placeholders(sql), params)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(translate_placeholders(sql), seq_of_params)
+        return self
+
+    def fetchone(self):
+        return _convert_row(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [_convert_row(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+
+class PostgresConnection:
+    """sqlite3.Connection-compatible wrapper around a psycopg connection"""
+
+    def __init__(self, conn):
+        self.raw = conn
+
+    def cursor(self):
+        return PostgresCursor(self.raw.cursor())
+
+    def execute(self, sql, params=None):
+        return self.cursor().execute(sql, params)
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        self.raw.close()
+
+    @property
+    def in_transaction(self):
+        return self.raw.info.transaction_status != TransactionStatus.IDLE
+
+
+class PostgresConnectionPool:
+    """
+    psycopg_pool.ConnectionPool exposed through the same acquire/release/stats
+    interface as db.SQLiteConnectionPool.
+    """
+
+    def __init__(self, url, max_size, timeout, health_check_interval, timeout_error):
+        if psycopg is None:
+            raise RuntimeError("DB_BACKEND=postgres requires 'psycopg[binary]' and 'psycopg_pool'")
+        self.max_size = max_size
+        self.timeout = timeout
+        self.timeout_error = timeout_error
+        self._pool = ConnectionPool(
+            url,
+            min_size=1,
+            max_size=max_size,
+            timeout=timeout,
+            max_idle=max(health_check_interval * 10, 60),
+            check=ConnectionPool.check_connection,  # Health check on checkout
+            open=True
+        )
+        self._lock = threading.Lock()
+        self._in_use = 0
+
+    def acquire(self):
+        try:
+            raw = self._pool.getconn()
+        except PoolTimeout as e:
+            raise self.timeout_error(f"No database connection available within {self.timeout}s: {e}")
+        with self._lock:
+            self._in_use += 1
+        return PostgresConnection(raw)
+
+    def release(self, conn):
+        with self._lock:
+            self._in_use -= 1
+        # putconn rolls back any open transaction before the connection is reused
+        self._pool.putconn(conn.raw)
+
+    def close_all(self):
+        self._pool.close()
+
+    def stats(self):
+        stats = self._pool.get_stats()
+        with self._lock:
+            in_use = self._in_use
+        return {
+            'max_size': self.max_size,
+            'size': stats.get('pool_size', 0),
+            'in_use': in_use,
+            'idle': stats.get('pool_available', 0),
+            'checkouts': stats.get('requests_num', 0),
+            'waits': stats.get('requests_queued', 0),
+            'wait_time_ms': stats.get('requests_wait_ms', 0),
+            'timeouts': stats.get('requests_errors', 0),
+            'health_check_failures': stats.get('connections_lost', 0)
+        }
+
+
+def initialize_database(pool, schema_upgrades):
+    """Create missing tables, columns and indexes (all statements are idempotent)"""
+    conn = pool.acquire()
+    try:
+        cursor = conn.raw.cursor()
+        for table, column, declaration in schema_upgrades:
+            declaration = ' '.join(TYPE_MAP.get(word, word) for word in declaration.split())
+            cursor.execute(
+                "SELECT 1 FROM information_schema.tables WHERE table_name = %s", (table,)
+            )
+            if cursor.fetchone():
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {declaration}")
+        with open(SCHEMA_PATH, 'r') as f:
+            cursor.execute(f.read())
+        conn.commit()
+        print("✅ PostgreSQL schema is up to date")
+    except Exception as e:
+        conn.rollback()
+        print(f"Warning: PostgreSQL schema initialization failed: {e}")
+        raise
+    finally:
+        pool.release(conn)
@@ -0,0 +1,49 @@
+import hashlib
+from flask import request, make_response
+
+# Conditional GET for polling clients. Each owner and user has a version
+# counter in `sync_versions`, bumped whenever one of their files changes
+# (see file_changes.record_change). A listing's weak ETag is derived from that
+# counter, so an unchanged listing is answered with 304 after a single
+# primary-key lookup instead of the full query.
+
+
+def bump_versions(cursor, *principal_ids):
+    """Increment the version of each owner/user id. Caller commits."""
+    for principal_id in set(p for p in principal_ids if p):
+        cursor.execute(
+            """INSERT INTO sync_versions (principal_id, version) VALUES (?, 1)
+               ON CONFLICT (principal_id) DO UPDATE SET version = sync_versions.version + 1""",
+            (principal_id,)
+        )
+
+
+def get_version(cursor, principal_id):
+    cursor.execute("SELECT version FROM sync_versions WHERE principal_id = ?", (principal_id,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def make_etag(principal_id, version):
+    """Weak ETag value for the current URL (path + query) at a given version"""
+    digest = hashlib.sha256(f"{principal_id}|{request.full_path}".encode()).hexdigest()[:16]
+    return f"{version}-{digest}"
+
+
+def not_modified(etag):
+    """Return a 304 response if the client already has `etag`, otherwise None"""
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+        response.set_etag(etag, weak=True)
+        return response
+    return None
+
+
+def with_etag(response, etag):
+    """Attach a weak ETag to a (response, status) tuple or response object"""
+    response = make_response(response)
+    if response.status_code == 200:
+        response.set_etag(etag, weak=True)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    return response
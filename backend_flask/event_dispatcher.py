@@ -0,0 +1,227 @@
+import os
+import time
+import heapq
+import queue
+import zlib
+import logging
+import threading
+from sse_manager import sse_manager, user_channel
+
+logger = logging.getLogger(__name__)
+
+# Routes hand events to the dispatcher and return immediately; worker threads
+# do the SSE fan-out (and any broker I/O) off the request path.
+# Each owner is pinned to one worker queue, so an owner's events stay in order.
+# SSE_DISPATCH_WORKERS=0 publishes inline (useful when debugging).
+SSE_DISPATCH_WORKERS = int(os.getenv('SSE_DISPATCH_WORKERS', 2))
+SSE_DISPATCH_CAPACITY = int(os.getenv('SSE_DISPATCH_CAPACITY', 10000))  # Queued events across all workers
+
+# Optional burst coalescing: events of these types for the same owner that
+# arrive within the window are sent as one '<type>_batch' event
+# ({"count": n, "files": [...]}). A lone event is sent unchanged. 0 disables.
+# Only enable it for clients that understand '*_batch': the desktop app's
+# dashboard handles new_file_batch (status_update is not shown there either);
+# the mobile app has no SSE client yet.
+SSE_COALESCE_WINDOW_MS = float(os.getenv('SSE_COALESCE_WINDOW_MS', 0))
+SSE_COALESCE_TYPES = [t.strip() for t in os.getenv('SSE_COALESCE_TYPES', 'new_file,status_update').split(',') if t.strip()]
+SSE_COALESCE_MAX_BATCH = int(os.getenv('SSE_COALESCE_MAX_BATCH', 100))
+
+
+class EventDispatcher:
+    def __init__(self, publish, workers=SSE_DISPATCH_WORKERS, capacity=SSE_DISPATCH_CAPACITY,
+                 coalesce_window_ms=SSE_COALESCE_WINDOW_MS, coalesce_types=SSE_COALESCE_TYPES,
+                 max_batch=SSE_COALESCE_MAX_BATCH):
+        self.publish = publish
+        self.workers = workers
+        self.capacity = capacity
+        self.coalesce_window = coalesce_window_ms / 1000.0
+        self.coalesce_types = set(coalesce_types)
+        self.max_batch = max_batch
+        # (owner_id, event_type) -> list of event data waiting for its window to close
+        self._pending = {}
+        self._deadlines = []  # Heap of (deadline, seq, key, batch)
+        self._deadline_seq = 0
+        self._coalesce_cond = threading.Condition()
+        self._queues = []
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._delivered = 0
+        self._dropped = 0
+        self._errors = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._coalesced = 0
+        self._batches = 0
+
+    def _ensure_started(self):
+        # Started lazily, and again in a forked child (threads do not survive fork)
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queues = []
+            self._threads = []
+            if self.workers > 0:
+                per_worker = max(1, self.capacity // self.workers)
+                self._queues = [queue.Queue(maxsize=per_worker) for _ in range(self.workers)]
+                for i, q in enumerate(self._queues):
+                    thread = threading.Thread(target=self._run, args=(q,), name=f'sse-dispatch-{i}', daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+            if self.coalesce_window > 0:
+                thread = threading.Thread(target=self._run_coalescer, name='sse-coalesce', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._pid = os.getpid()
+
+    def dispatch(self, owner_id, event_type, data):
+        """
+        Queue an event for owner_id. Never blocks; returns False if the event
+        was dropped because the owner's worker queue is full.
+        """
+        with self._lock:
+            self._submitted += 1
+        self._ensure_started()
+
+        if self.coalesce_window > 0:
+            if event_type in self.coalesce_types:
+                return self._add_to_batch(owner_id, event_type, data)
+            # Keep the owner's order: anything held back goes out first
+            self._flush_owner(owner_id)
+        return self._enqueue(owner_id, event_type, data)
+
+    def _add_to_batch(self, owner_id, event_type, data):
+        key = (owner_id, event_type)
+        with self._coalesce_cond:
+            batch = self._pending.get(key)
+            if batch is None:
+                batch = self._pending[key] = []
+                self._deadline_seq += 1
+                heapq.heappush(self._deadlines, (time.monotonic() + self.coalesce_window,
+                                                 self._deadline_seq, key, batch))
+                self._coalesce_cond.notify()
+            batch.append(data)
+            if len(batch) < self.max_batch:
+                return True
+            del self._pending[key]
+            return self._enqueue_batch(key, batch)
+
+    def _flush_owner(self, owner_id):
+        with self._coalesce_cond:
+            due = [(key, self._pending.pop(key)) for key in list(self._pending) if key[0] == owner_id]
+            for key, batch in due:
+                self._enqueue_batch(key, batch)
+
+    def _run_coalescer(self):
+        while True:
+            with self._coalesce_cond:
+                while not self._deadlines:
+                    self._coalesce_cond.wait()
+                deadline = self._deadlines[0][0]
+                now = time.monotonic()
+                if deadline > now:
+                    self._coalesce_cond.wait(deadline - now)
+                    continue
+                _, _, key, batch = heapq.heappop(self._deadlines)
+                # Skip heap entries for batches already sent (max_batch or owner flush)
+                if self._pending.get(key) is not batch:
+                    continue
+                del self._pending[key]
+                self._enqueue_batch(key, batch)
+
+    def _enqueue_batch(self, key, batch):
+        # Called with _coalesce_cond held: a batch leaves _pending and enters its
+        # worker queue in one step, so a later non-coalesced event for the same
+        # owner (which flushes under that lock first) cannot overtake it.
+        # _enqueue only does put_nowait (or publishes inline when debugging with
+        # no workers), so the lock is never held while waiting on a queue.
+        owner_id, event_type = key
+        if len(batch) == 1:
+            return self._enqueue(owner_id, event_type, batch[0])
+        with self._lock:
+            self._coalesced += len(batch)
+            self._batches += 1
+        return self._enqueue(owner_id, f"{event_type}_batch", {'count': len(batch), 'files': batch})
+
+    def _enqueue(self, owner_id, event_type, data):
+        if self.workers <= 0:
+            self._deliver(owner_id, event_type, data, time.monotonic())
+            return True
+
+        q = self._queues[zlib.crc32(owner_id.encode()) % len(self._queues)]
+        try:
+            q.put_nowait((owner_id, event_type, data, time.monotonic()))
+            return True
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+            logger.warning(f"Event dispatcher full; dropped '{event_type}' for {owner_id}")
+            return False
+
+    def _run(self, q):
+        while True:
+            owner_id, event_type, data, queued_at = q.get()
+            try:
+                self._deliver(owner_id, event_type, data, queued_at)
+            finally:
+                q.task_done()
+
+    def _deliver(self, owner_id, event_type, data, queued_at):
+        try:
+            self.publish(owner_id, event_type, data)
+        except Exception as e:
+            with self._lock:
+                self._errors += 1
+            logger.error(f"Event dispatch error for {owner_id}: {e}")
+            return
+        latency = time.monotonic() - queued_at
+        with self._lock:
+            self._delivered += 1
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+
+    def flush(self, timeout=5):
+        """Send held-back batches and wait until queued events are delivered. Returns False on timeout."""
+        with self._coalesce_cond:
+            for key, batch in self._pending.items():
+                self._enqueue_batch(key, batch)
+            self._pending.clear()
+        deadline = time.monotonic() + timeout
+        for q in list(self._queues):
+            while q.unfinished_tasks:
+                if time.monotonic() > deadline:
+                    return False
+                time.sleep(0.005)
+        return True
+
+    def stats(self):
+        with self._lock:
+            delivered = self._delivered
+            return {
+                'workers': self.workers,
+                'capacity': self.capacity,
+                'queued': sum(q.qsize() for q in self._queues),
+                'submitted': self._submitted,
+                'delivered': delivered,
+                'dropped': self._dropped,
+                'errors': self._errors,
+                'avg_latency_ms': round(self._latency_total / delivered * 1000, 3) if delivered else 0,
+                'max_latency_ms': round(self._latency_max * 1000, 3),
+                'coalesce_window_ms': self.coalesce_window * 1000,
+                'coalesced': self._coalesced,
+                'batches': self._batches
+            }
+
+
+# Global instance
+event_dispatcher = EventDispatcher(sse_manager.publish)
+
+
+def publish_file_event(owner_id, user_id, event_type, data):
+    """Queue a file event for its owner and for the user who uploaded it"""
+    event_dispatcher.dispatch(owner_id, event_type, data)
+    if user_id:
+        event_dispatcher.dispatch(user_channel(user_id), event_type, data)
@@ -0,0 +1,92 @@
+"""
+Change log behind /api/files/changes.
+
+Every write to `files` appends a row to `file_changes` in the same transaction,
+so a client can ask for everything after the last sequence number it saw
+instead of re-fetching the whole listing. The session sweeper prunes rows
+older than FILE_CHANGES_RETENTION_DAYS; a client whose sequence number is
+older than the pruned range is told to re-list.
+"""
+
+import os
+from etag_utils import bump_versions
+
+FILE_CHANGES_RETENTION_DAYS = int(os.getenv('FILE_CHANGES_RETENTION_DAYS', 30))  # 0 keeps everything
+
+CHANGE_INSERT = 'insert'
+CHANGE_STATUS = 'status'
+CHANGE_DELETE = 'delete'
+
+
+def record_change(cursor, file_id, owner_id, user_id, change_type, status=None):
+    """
+    Append one change and bump the owner's and user's listing versions.
+    Caller commits together with the files write.
+    """
+    cursor.execute(
+        """INSERT INTO file_changes (file_id, owner_id, user_id, change_type, status)
+           VALUES (?, ?, ?, ?, ?)""",
+        (file_id, owner_id, user_id, change_type, status)
+    )
+    bump_versions(cursor, owner_id, user_id)
+
+
+def record_deletions(cursor, where_sql, params):
+    """
+    Write tombstones for the files matching a WHERE clause.
+    Call before the DELETE runs, in the same transaction.
+    """
+    cursor.execute(f"SELECT id, owner_id, user_id, status FROM files WHERE {where_sql}", params)
+    rows = cursor.fetchall()
+    for row in rows:
+        record_change(cursor, row[0], row[1], row[2], CHANGE_DELETE, row[3])
+    return len(rows)
+
+
+def fetch_changes(cursor, column, principal_id, since, limit):
+    """
+    Changes visible to an owner (column='owner_id') or user (column='user_id')
+    after `since`, oldest first. Returns up to limit + 1 rows of
+    (seq, file_id, change_type) so callers can tell whether more remain.
+    """
+    if column not in ('owner_id', 'user_id'):
+        raise ValueError(f"Unsupported change column: {column}")
+    cursor.execute(
+        f"""SELECT seq, file_id, change_type FROM file_changes
+            WHERE {column} = ? AND seq > ?
+            ORDER BY seq LIMIT ?""",
+        (principal_id, since, limit + 1)
+    )
+    return cursor.fetchall()
+
+
+def pruned_through(cursor):
+    """Highest seq removed by pruning (0 if nothing has been pruned)"""
+    cursor.execute("SELECT seq FROM file_changes_pruned WHERE id = 1")
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def latest_seq(cursor):
+    cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM file_changes")
+    return cursor.fetchone()[0]
+
+
+def mark_pruned(cursor, before):
+    """
+    Record that changes made before `before` are about to be deleted and
+    return the highest seq among them (0 if none). Committed before the
+    deletes, so a client never misses a change without being told to re-list.
+    """
+    # seq + 0: plain MAX(seq) makes SQLite walk the primary key from the newest
+    # row instead of reading just the old range from idx_file_changes_changed_at
+    cursor.execute("SELECT COALESCE(MAX(seq + 0), 0) FROM file_changes WHERE changed_at < ?", (before,))
+    cutoff = cursor.fetchone()[0]
+    if cutoff:
+        cursor.execute(
+            """INSERT INTO file_changes_pruned (id, seq) VALUES (1, ?)
+               ON CONFLICT (id) DO UPDATE SET seq = CASE WHEN excluded.seq > file_changes_pruned.seq
+                                                         THEN excluded.seq ELSE file_changes_pruned.seq END""",
+            (cutoff,)
+        )
+    return cutoff
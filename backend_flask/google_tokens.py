@@ -0,0 +1,239 @@
+"""
+Local verification of Google ID tokens.
+
+Sign-in used to call oauth2.googleapis.com/tokeninfo for every login. Google
+signs ID tokens with keys published as a JWKS document that changes rarely and
+is served with a Cache-Control max-age, so the keys are fetched once, cached
+for that long, and each token is checked here (signature, expiry, issuer,
+audience) without a network round trip.
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+import jwt
+from http_client import http_client
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+GOOGLE_JWKS_URL = os.getenv('GOOGLE_JWKS_URL', 'https://www.googleapis.com/oauth2/v3/certs')
+# Where signing keys come from:
+#   http - GOOGLE_JWKS_URL (production)
+#   file - a local JWKS file at GOOGLE_JWKS_FILE (tests, offline development)
+GOOGLE_KEY_SOURCE = os.getenv('GOOGLE_KEY_SOURCE', 'http')
+GOOGLE_JWKS_FILE = os.getenv('GOOGLE_JWKS_FILE', '')
+GOOGLE_JWKS_DEFAULT_MAX_AGE = 3600  # Seconds, when the response has no usable max-age
+GOOGLE_JWKS_MIN_REFRESH = 60  # Seconds between refreshes forced by an unknown key id
+GOOGLE_TOKEN_LEEWAY = 60  # Seconds of clock skew tolerated on exp/iat
+
+
+class GoogleKeysUnavailableError(Exception):
+    """Signing keys could not be fetched and none are cached (HTTP 503)"""
+    pass
+
+
+def parse_max_age(cache_control):
+    """max-age from a Cache-Control header, or None"""
+    match = re.search(r'max-age=(\d+)', cache_control or '')
+    return int(match.group(1)) if match else None
+
+
+class KeySource:
+    """Supplies a JWKS document. fetch() returns (jwks_dict, max_age_seconds_or_None)."""
+    name = None
+
+    def fetch(self):
+        raise NotImplementedError
+
+
+class HTTPKeySource(KeySource):
+    name = 'http'
+
+    def __init__(self, url):
+        self.url = url
+
+    def fetch(self):
+        response = http_client.get(self.url)
+        response.raise_for_status()
+        return response.json(), parse_max_age(response.headers.get('Cache-Control'))
+
+
+class StaticKeySource(KeySource):
+    """Fixed key set, e.g. a test signing key"""
+    name = 'static'
+
+    def __init__(self, jwks, max_age=None):
+        self.jwks = jwks
+        self.max_age = max_age
+
+    def fetch(self):
+        return self.jwks, self.max_age
+
+
+class FileKeySource(KeySource):
+    name = 'file'
+
+    def __init__(self, path):
+        self.path = path
+
+    def fetch(self):
+        with open(self.path, 'r') as f:
+            return json.load(f), None
+
+
+class JWKSCache:
+    """
+    kid -> public key, refreshed when the source's max-age runs out or a token
+    names an unknown kid (key rotation). Only one thread fetches at a time;
+    others wait for that fetch instead of starting their own.
+    """
+
+    def __init__(self, source, default_max_age=GOOGLE_JWKS_DEFAULT_MAX_AGE, min_refresh=GOOGLE_JWKS_MIN_REFRESH):
+        self.source = source
+        self.default_max_age = default_max_age
+        self.min_refresh = min_refresh
+        self._keys = {}
+        self._expires_at = 0
+        self._fetched_at = 0
+        self._cond = threading.Condition()
+        self._refreshing = False
+        self._generation = 0  # Bumped after every refresh attempt
+        self._refreshes = 0
+        self._errors = 0
+        self._waits = 0
+
+    def set_source(self, source):
+        """Swap the key source and forget cached keys"""
+        with self._cond:
+            self.source = source
+            self._keys = {}
+            self._expires_at = 0
+            self._fetched_at = 0
+
+    def get_key(self, kid):
+        now = time.time()
+        with self._cond:
+            key = self._keys.get(kid)
+            if key is not None and now < self._expires_at:
+                return key
+            # Unknown kid with fresh keys: refetch at most every min_refresh
+            if key is None and now < self._expires_at and now - self._fetched_at < self.min_refresh:
+                return None
+        self._refresh()
+        with self._cond:
+            key = self._keys.get(kid)
+            if key is None and not self._keys:
+                raise GoogleKeysUnavailableError("Google signing keys are unavailable")
+            return key
+
+    def _refresh(self):
+        with self._cond:
+            if self._refreshing:
+                # Another thread is fetching; wait for its result
+                self._waits += 1
+                generation = self._generation
+                while self._refreshing and self._generation == generation:
+                    self._cond.wait(http_client.timeout[0] + http_client.timeout[1])
+                return
+            self._refreshing = True
+            source = self.source
+        try:
+            jwks, max_age = source.fetch()
+            keys = {}
+            for jwk in jwks.get('keys', []):
+                try:
+                    keys[jwk['kid']] = jwt.PyJWK(jwk).key
+                except (KeyError, jwt.PyJWKError) as e:
+                    logger.warning(f"Skipping unusable JWKS key: {e}")
+            with self._cond:
+                self._keys = keys
+                self._fetched_at = time.time()
+                self._expires_at = self._fetched_at + (max_age if max_age is not None else self.default_max_age)
+                self._refreshes += 1
+        except Exception as e:
+            # Keep serving the keys we have (if any) and retry after min_refresh
+            with self._cond:
+                self._errors += 1
+                self._fetched_at = time.time()
+                if self._keys:
+                    self._expires_at = self._fetched_at + self.min_refresh
+            logger.error(f"Google JWKS refresh failed: {e}")
+        finally:
+            with self._cond:
+                self._refreshing = False
+                self._generation += 1
+                self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'source': self.source.name,
+                'keys': len(self._keys),
+                'expires_in': max(0, round(self._expires_at - time.time())),
+                'refreshes': self._refreshes,
+                'errors': self._errors,
+                'waits': self._waits
+            }
+
+
+class GoogleIDTokenVerifier:
+    def __init__(self, key_cache, issuers=GOOGLE_ISSUERS, leeway=GOOGLE_TOKEN_LEEWAY):
+        self.key_cache = key_cache
+        self.issuers = issuers
+        self.leeway = leeway
+        self._lock = threading.Lock()
+        self._verified = 0
+        self._rejected = 0
+
+    def verify(self, id_token, audience):
+        """
+        Verify an ID token's signature, expiry, issuer and audience. Returns the
+        claims; raises jwt.InvalidTokenError subclasses, or
+        GoogleKeysUnavailableError when no keys can be loaded.
+        """
+        try:
+            header = jwt.get_unverified_header(id_token)
+            key = self.key_cache.get_key(header.get('kid'))
+            if key is None:
+                raise jwt.InvalidTokenError("Unknown signing key")
+            claims = jwt.decode(id_token, key, algorithms=['RS256'], audience=audience,
+                                leeway=self.leeway, options={'require': ['exp', 'iat', 'iss', 'aud']})
+            if claims.get('iss') not in self.issuers:
+                raise jwt.InvalidIssuerError("Invalid issuer")
+        except jwt.InvalidTokenError:
+            with self._lock:
+                self._rejected += 1
+            raise
+        with self._lock:
+            self._verified += 1
+        return claims
+
+    def stats(self):
+        with self._lock:
+            stats = {'verified': self._verified, 'rejected': self._rejected}
+        stats['jwks'] = self.key_cache.stats()
+        return stats
+
+
+# Available key sources, selected with GOOGLE_KEY_SOURCE
+GOOGLE_KEY_SOURCES = {
+    'http': lambda: HTTPKeySource(GOOGLE_JWKS_URL),
+    'file': lambda: FileKeySource(GOOGLE_JWKS_FILE),
+}
+
+
+def create_key_source(name=GOOGLE_KEY_SOURCE):
+    if name not in GOOGLE_KEY_SOURCES:
+        raise ValueError(f"Unknown GOOGLE_KEY_SOURCE '{name}'. Options: {', '.join(GOOGLE_KEY_SOURCES)}")
+    return GOOGLE_KEY_SOURCES[name]()
+
+
+# Global instance
+google_token_verifier = GoogleIDTokenVerifier(JWKSCache(create_key_source()))
@@ -0,0 +1,227 @@
+"""
+Shared client for outbound HTTP calls (Google OAuth).
+
+One requests.Session per process keeps TLS connections alive between calls.
+Every request has connect/read timeouts, so a slow upstream cannot hold a
+worker forever. Failed attempts are retried a bounded number of times with
+jittered backoff. A per-host circuit breaker fails fast while an upstream
+keeps failing.
+"""
+
+import os
+import time
+import random
+import logging
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 3))  # Seconds
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 10))
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 10))  # Kept-alive connections per host
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', 2))  # Extra attempts after the first
+HTTP_RETRY_BACKOFF = float(os.getenv('HTTP_RETRY_BACKOFF', 0.2))  # Base delay (s), doubled per attempt, full jitter
+# Open the breaker after this many consecutive failures; probe again after the cooldown
+HTTP_BREAKER_THRESHOLD = int(os.getenv('HTTP_BREAKER_THRESHOLD', 5))
+HTTP_BREAKER_COOLDOWN = float(os.getenv('HTTP_BREAKER_COOLDOWN', 30))
+
+# Safe to resend after the request may have reached the server
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised without a network call while a host's breaker is open"""
+    pass
+
+
+def _not_sent(error):
+    """True if the request failed before reaching the server (safe to resend any method)"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        # Refused / DNS failure: urllib3 never opened the connection
+        return isinstance(getattr(error.args[0], 'reason', None), NewConnectionError)
+    return False
+
+
+class CircuitBreaker:
+    """closed -> open after `threshold` consecutive failures -> half_open (one probe) after `cooldown`"""
+
+    def __init__(self, threshold=HTTP_BREAKER_THRESHOLD, cooldown=HTTP_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0
+        self.opens = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = 'half_open'
+                return True  # This caller is the probe
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or (self.state == 'closed' and self.failures >= self.threshold):
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self.opens += 1
+
+    def stats(self):
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures, 'opens': self.opens}
+
+
+class HostStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'retries': self.retries,
+            'rejected': self.rejected,
+            'avg_latency_ms': round(self.latency_total / self.requests * 1000, 2) if self.requests else 0,
+            'max_latency_ms': round(self.latency_max * 1000, 2)
+        }
+
+
+class HTTPClient:
+    def __init__(self, connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT,
+                 pool_size=HTTP_POOL_SIZE, retries=HTTP_RETRIES, backoff=HTTP_RETRY_BACKOFF,
+                 breaker_threshold=HTTP_BREAKER_THRESHOLD, breaker_cooldown=HTTP_BREAKER_COOLDOWN):
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self._session = None
+        self._pid = None
+        self._breakers = {}  # host -> CircuitBreaker
+        self._stats = {}  # host -> HostStats
+        self._lock = threading.Lock()
+
+    def _get_session(self):
+        # Created lazily, and again after fork (pooled sockets must not be shared)
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+                    self._pid = os.getpid()
+        return self._session
+
+    def _host(self, host):
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_cooldown)
+                self._stats[host] = HostStats()
+            return self._breakers[host], self._stats[host]
+
+    def request(self, method, url, retry=None, **kwargs):
+        """
+        Send a request with timeouts, retries and the host's circuit breaker.
+        retry defaults to True for idempotent methods; other methods are only
+        retried when the connection failed before the request was sent.
+        Raises requests exceptions (CircuitOpenError while the breaker is open).
+        """
+        method = method.upper()
+        if retry is None:
+            retry = method in IDEMPOTENT_METHODS
+        kwargs.setdefault('timeout', self.timeout)
+        host = urlsplit(url).netloc
+        breaker, stats = self._host(host)
+
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                with self._lock:
+                    stats.rejected += 1
+                raise CircuitOpenError(f"Circuit open for {host}")
+
+            started = time.monotonic()
+            error = None
+            response = None
+            try:
+                response = self._get_session().request(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                error = e
+            elapsed = time.monotonic() - started
+
+            failed = error is not None or response.status_code in RETRY_STATUSES
+            with self._lock:
+                stats.requests += 1
+                stats.latency_total += elapsed
+                stats.latency_max = max(stats.latency_max, elapsed)
+                if failed:
+                    stats.errors += 1
+            if failed:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+                return response
+
+            if attempt >= self.retries or not (retry or _not_sent(error)):
+                if error is not None:
+                    raise error
+                return response  # Caller sees the 5xx/429 as before
+
+            attempt += 1
+            with self._lock:
+                stats.retries += 1
+            delay = random.uniform(0, self.backoff * (2 ** (attempt - 1)))
+            logger.warning(f"Retrying {method} {host} in {delay:.2f}s (attempt {attempt}): "
+                           f"{error or response.status_code}")
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            hosts = {host: stats.as_dict() for host, stats in self._stats.items()}
+            breakers = dict(self._breakers)
+        for host, breaker in breakers.items():
+            hosts[host]['breaker'] = breaker.stats()
+        return {
+            'connect_timeout': self.timeout[0],
+            'read_timeout': self.timeout[1],
+            'retries': self.retries,
+            'hosts': hosts
+        }
+
+
+# Global instance
+http_client = HTTPClient()
@@ -0,0 +1,93 @@
+"""
+Database Migration: Move Inline Ciphertext to the Blob Store
+
+Copies `files.encrypted_file_data` for rows uploaded before the blob store
+into BLOB_STORE_DIR, sets `blob_ref` and empties the inline column.
+Safe to run multiple times (only rows without a blob_ref are processed).
+Run VACUUM afterwards to return the freed pages to the filesystem.
+"""
+
+import sqlite3
+import os
+import sys
+
+from blob_store import blob_store, BLOB_STORE_PATH
+
+# Database path
+DB_FILE = os.getenv('DB_FILE', 'database.sqlite')
+DB_PATH = os.path.join(os.path.dirname(__file__), DB_FILE)
+
+BATCH_SIZE = 20
+
+def migrate_database(vacuum=False):
+    """Move inline file bodies into the blob store"""
+    
+    if not os.path.exists(DB_PATH):
+        print(f"❌ Database not found at: {DB_PATH}")
+        print("   Run the server first to create the database, then run this migration.")
+        return
+    
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute("PRAGMA table_info(files)")
+        columns = [col[1] for col in cursor.fetchall()]
+        
+        if 'blob_ref' not in columns:
+            print("📝 Adding blob_ref column...")
+            cursor.execute("ALTER TABLE files ADD COLUMN blob_ref TEXT")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_blob_ref ON files(blob_ref)")
+            conn.commit()
+        
+        moved = 0
+        moved_bytes = 0
+        while True:
+            # Batches keep at most BATCH_SIZE file bodies in memory
+            cursor.execute("""
+                SELECT id, encrypted_file_data FROM files
+                WHERE blob_ref IS NULL AND length(encrypted_file_data) > 0
+                LIMIT ?
+            """, (BATCH_SIZE,))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            
+            for file_id, data in rows:
+                ref = blob_store.put(bytes(data))
+                cursor.execute(
+                    "UPDATE files SET blob_ref = ?, encrypted_file_data = X'' WHERE id = ?",
+                    (ref, file_id)
+                )
+                moved += 1
+                moved_bytes += len(data)
+            conn.commit()
+            print(f"   Moved {moved} files so far...")
+        
+        print(f"✅ Migration completed successfully!")
+        print(f"   - Moved {moved} files ({moved_bytes} bytes) to {BLOB_STORE_PATH}")
+        
+        if vacuum and moved:
+            print("📝 Running VACUUM...")
+            conn.execute("VACUUM")
+            print("✅ VACUUM completed")
+        
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("BLOB STORE MIGRATION")
+    print("=" * 60)
+    print(f"Database: {DB_PATH}")
+    print()
+    
+    migrate_database(vacuum='--vacuum' in sys.argv)
+    
+    print()
+    print("=" * 60)
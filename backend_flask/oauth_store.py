@@ -0,0 +1,240 @@
+"""
+Pending desktop Google sign-ins.
+
+The desktop app opens /api/owners/google/login in a browser and then asks
+/api/owners/google/status for the result, which /api/owners/google/callback
+stores. With several workers those requests land on different processes, so
+the state has to live somewhere they all see:
+  database - the oauth_sessions table in the main database (default)
+  memory   - this process only (development server, gunicorn -w 1)
+Entries expire after OAUTH_SESSION_TTL seconds.
+"""
+
+import os
+import json
+import time
+import heapq
+import threading
+from dotenv import load_dotenv
+from db import acquire_db_connection, release_db_connection
+
+load_dotenv()
+
+OAUTH_SESSION_STORE = os.getenv('OAUTH_SESSION_STORE', 'database')
+OAUTH_SESSION_TTL = int(os.getenv('OAUTH_SESSION_TTL', 300))  # Seconds
+OAUTH_POLL_INTERVAL = float(os.getenv('OAUTH_POLL_INTERVAL', 0.25))  # Seconds between checks while waiting
+OAUTH_PURGE_INTERVAL = 30  # Seconds between expired-row deletes (database store)
+
+STATUS_PENDING = 'pending'
+STATUS_SUCCESS = 'success'
+
+
+class OAuthSessionStore:
+    """
+    create() registers a pending sign-in, complete() stores its result,
+    take() returns a completed result once and removes it, and wait() blocks
+    until a sign-in completes or the timeout passes.
+    """
+    name = None
+
+    def __init__(self, ttl=OAUTH_SESSION_TTL):
+        self.ttl = ttl
+        # Wakes waiters in this process as soon as complete() runs here
+        self._cond = threading.Condition()
+
+    def create(self, session_id):
+        raise NotImplementedError
+
+    def exists(self, session_id):
+        raise NotImplementedError
+
+    def complete(self, session_id, result):
+        """Mark a pending sign-in successful. Returns False if it is unknown or expired."""
+        raise NotImplementedError
+
+    def take(self, session_id):
+        """The result of a completed sign-in (removing it), or None while pending/unknown"""
+        raise NotImplementedError
+
+    def _notify(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def wait(self, session_id, timeout):
+        """take(), retried until a result arrives or `timeout` seconds pass"""
+        deadline = time.monotonic() + timeout
+        while True:
+            result = self.take(session_id)
+            remaining = deadline - time.monotonic()
+            if result is not None or remaining <= 0:
+                return result
+            # Completions in this process wake us at once; other workers' are
+            # picked up on the next poll
+            with self._cond:
+                self._cond.wait(min(OAUTH_POLL_INTERVAL, remaining))
+
+    def stats(self):
+        return {'backend': self.name, 'ttl': self.ttl}
+
+
+class MemoryOAuthSessionStore(OAuthSessionStore):
+    """dict plus an expiry heap, so purging is O(expired log n) instead of a full scan"""
+    name = 'memory'
+
+    def __init__(self, ttl=OAUTH_SESSION_TTL):
+        super().__init__(ttl)
+        self._lock = threading.Lock()
+        self._sessions = {}  # session_id -> {'status', 'result', 'expires_at'}
+        self._expiry = []  # Heap of (expires_at, session_id)
+
+    def _purge(self, now):
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, session_id = heapq.heappop(self._expiry)
+            entry = self._sessions.get(session_id)
+            # Skip heap entries left behind by a later create() of the same id
+            if entry is not None and entry['expires_at'] == expires_at:
+                del self._sessions[session_id]
+
+    def create(self, session_id):
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            expires_at = now + self.ttl
+            self._sessions[session_id] = {'status': STATUS_PENDING, 'result': None, 'expires_at': expires_at}
+            heapq.heappush(self._expiry, (expires_at, session_id))
+
+    def exists(self, session_id):
+        with self._lock:
+            self._purge(time.time())
+            return session_id in self._sessions
+
+    def complete(self, session_id, result):
+        with self._lock:
+            self._purge(time.time())
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return False
+            entry['status'] = STATUS_SUCCESS
+            entry['result'] = result
+        self._notify()
+        return True
+
+    def take(self, session_id):
+        with self._lock:
+            self._purge(time.time())
+            entry = self._sessions.get(session_id)
+            if entry is None or entry['status'] != STATUS_SUCCESS:
+                return None
+            del self._sessions[session_id]
+            return entry['result']
+
+    def stats(self):
+        with self._lock:
+            stats = super().stats()
+            stats['sessions'] = len(self._sessions)
+            return stats
+
+
+class DatabaseOAuthSessionStore(OAuthSessionStore):
+    """oauth_sessions table, primary-key lookups plus an expires_at index for purging"""
+    name = 'database'
+
+    def __init__(self, ttl=OAUTH_SESSION_TTL):
+        super().__init__(ttl)
+        self._next_purge = 0
+
+    def _maybe_purge(self, cursor, now):
+        if now < self._next_purge:
+            return
+        self._next_purge = now + OAUTH_PURGE_INTERVAL
+        cursor.execute("DELETE FROM oauth_sessions WHERE expires_at <= ?", (int(now),))
+
+    def create(self, session_id):
+        now = time.time()
+        conn = acquire_db_connection()
+        cursor = conn.cursor()
+        try:
+            self._maybe_purge(cursor, now)
+            cursor.execute(
+                """INSERT INTO oauth_sessions (id, status, result, expires_at) VALUES (?, ?, NULL, ?)
+                   ON CONFLICT (id) DO UPDATE SET status = excluded.status, result = NULL,
+                                                  expires_at = excluded.expires_at""",
+                (session_id, STATUS_PENDING, int(now + self.ttl))
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            release_db_connection(conn)
+
+    def exists(self, session_id):
+        conn = acquire_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT 1 FROM oauth_sessions WHERE id = ? AND expires_at > ?",
+                           (session_id, int(time.time())))
+            return cursor.fetchone() is not None
+        finally:
+            cursor.close()
+            release_db_connection(conn)
+
+    def complete(self, session_id, result):
+        conn = acquire_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "UPDATE oauth_sessions SET status = ?, result = ? WHERE id = ? AND expires_at > ?",
+                (STATUS_SUCCESS, json.dumps(result), session_id, int(time.time()))
+            )
+            updated = cursor.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            release_db_connection(conn)
+        self._notify()
+        return updated > 0
+
+    def take(self, session_id):
+        conn = acquire_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "SELECT result FROM oauth_sessions WHERE id = ? AND status = ? AND expires_at > ?",
+                (session_id, STATUS_SUCCESS, int(time.time()))
+            )
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            # Only the request whose DELETE wins hands out the token
+            cursor.execute("DELETE FROM oauth_sessions WHERE id = ? AND status = ?", (session_id, STATUS_SUCCESS))
+            taken = cursor.rowcount
+            conn.commit()
+            return json.loads(row[0]) if taken else None
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            release_db_connection(conn)
+
+
+# Available backends, selected with OAUTH_SESSION_STORE
+OAUTH_SESSION_STORES = {
+    'memory': lambda: MemoryOAuthSessionStore(),
+    'database': lambda: DatabaseOAuthSessionStore(),
+}
+
+
+def create_oauth_store(name=OAUTH_SESSION_STORE):
+    if name not in OAUTH_SESSION_STORES:
+        raise ValueError(f"Unknown OAUTH_SESSION_STORE '{name}'. Options: {', '.join(OAUTH_SESSION_STORES)}")
+    return OAUTH_SESSION_STORES[name]()
+
+
+# Global instance
+oauth_store = create_oauth_store()
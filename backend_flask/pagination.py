@@ -0,0 +1,71 @@
+import base64
+import json
+import os
+
+# Keyset pagination for list endpoints. Pages are addressed by the sort key of
+# the last row returned, so a deep page costs the same as the first one.
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', 100))
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 500))
+
+
+class InvalidCursorError(Exception):
+    """Raised for a malformed or tampered cursor / page size (HTTP 400)"""
+    pass
+
+
+def encode_cursor(sort_value, row_id):
+    """Opaque cursor for the row a page ended on"""
+    raw = json.dumps([sort_value, row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (sort_value, row_id) from encode_cursor(), or None for the first page"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort_value, row_id = json.loads(raw)
+    except Exception:
+        raise InvalidCursorError('Invalid cursor')
+    if not isinstance(sort_value, str) or not isinstance(row_id, str):
+        raise InvalidCursorError('Invalid cursor')
+    return sort_value, row_id
+
+
+def get_page_params(args):
+    """Parse ?limit=&cursor= from request args. Returns (page_size, after)."""
+    limit = args.get('limit')
+    if limit is None:
+        page_size = PAGE_SIZE
+    else:
+        try:
+            page_size = int(limit)
+        except ValueError:
+            raise InvalidCursorError('limit must be an integer')
+        if page_size < 1:
+            raise InvalidCursorError('limit must be positive')
+        page_size = min(page_size, MAX_PAGE_SIZE)
+    return page_size, decode_cursor(args.get('cursor'))
+
+
+def keyset_clause(sort_column, id_column, after):
+    """
+    SQL fragment and params selecting rows after a cursor, for
+    ORDER BY sort_column DESC, id_column DESC.
+    """
+    if after is None:
+        return '', ()
+    return f" AND ({sort_column}, {id_column}) < (?, ?)", tuple(after)
+
+
+def split_page(rows, page_size, sort_index, id_index):
+    """
+    Trim a LIMIT page_size + 1 result to one page.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    last = rows[-1]
+    return rows, encode_cursor(last[sort_index], last[id_index])
@@ -0,0 +1,156 @@
+"""
+In-memory deny list of revoked access tokens.
+
+token_required must reject revoked sessions without a sessions lookup on
+every request. Revocations are appended to the `revoked_tokens` table in the
+same transaction that invalidates the session. In each worker process a
+background thread loads the unexpired entries and then tails the table every
+REVOCATION_SYNC_INTERVAL seconds, so a logout on one worker reaches the others
+within that interval and is_revoked() never touches the database. The
+revoking worker applies it locally at once.
+"""
+
+import os
+import time
+import logging
+import threading
+from db import acquire_db_connection, release_db_connection
+
+logger = logging.getLogger(__name__)
+
+REVOCATION_SYNC_INTERVAL = float(os.getenv('REVOCATION_SYNC_INTERVAL', 1))  # Seconds between tails
+# Full reload, which also forgets expired entries and anything a tail skipped
+REVOCATION_RELOAD_INTERVAL = float(os.getenv('REVOCATION_RELOAD_INTERVAL', 300))
+# Sequence values are handed out at INSERT but become visible at COMMIT, so on
+# PostgreSQL a lower seq can appear after a higher one was read. Each tail
+# re-reads this many seqs below the highest seen to pick those up.
+REVOCATION_TAIL_OVERLAP = 100
+# How long the first check in a process waits for the initial load
+REVOCATION_LOAD_TIMEOUT = 5
+
+
+class RevocationList:
+    def __init__(self, sync_interval=REVOCATION_SYNC_INTERVAL, reload_interval=REVOCATION_RELOAD_INTERVAL):
+        self.sync_interval = sync_interval
+        self.reload_interval = reload_interval
+        self._revoked = {}  # token_hash -> expires_at (unix time)
+        self._last_seq = 0
+        self._pid = None  # Sync thread runs per process; a forked worker starts its own
+        self._next_reload = 0
+        self._loaded = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._checks = 0
+        self._rejected = 0
+        self._syncs = 0
+        self._reloads = 0
+        self._errors = 0
+
+    def is_revoked(self, token_hash):
+        self._ensure_started()
+        if not self._loaded.is_set():
+            # Only until the sync thread's first load in this process is done
+            self._loaded.wait(REVOCATION_LOAD_TIMEOUT)
+        with self._lock:
+            self._checks += 1
+            expires_at = self._revoked.get(token_hash)
+            if expires_at is None:
+                return False
+            self._rejected += 1
+            return True
+
+    def add(self, entries):
+        """Apply revocations committed by this process: iterable of (token_hash, expires_at)"""
+        with self._lock:
+            for token_hash, expires_at in entries:
+                self._revoked[token_hash] = expires_at
+
+    def _ensure_started(self):
+        # Started lazily, and again in a forked child (threads do not survive fork)
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._next_reload = 0
+            self._stop.clear()
+            thread = threading.Thread(target=self._run, name='revocation-sync', daemon=True)
+            thread.start()
+            self._pid = os.getpid()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while True:
+            try:
+                if time.monotonic() >= self._next_reload:
+                    self._reload()
+                else:
+                    self._tail()
+            except Exception as e:
+                # Keep serving from the current set; retried next interval
+                with self._lock:
+                    self._errors += 1
+                logger.error(f"Revocation list sync failed: {e}")
+            # Set after the first attempt even if it failed, so checks wait at
+            # most once while the database is unreachable
+            self._loaded.set()
+            if self._stop.wait(self.sync_interval):
+                return
+
+    def _reload(self):
+        conn = acquire_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "SELECT seq, token_hash, expires_at FROM revoked_tokens WHERE expires_at > ?",
+                (int(time.time()),)
+            )
+            rows = cursor.fetchall()
+            cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM revoked_tokens")
+            last_seq = cursor.fetchone()[0]
+        finally:
+            cursor.close()
+            release_db_connection(conn)
+        with self._lock:
+            self._revoked = {row[1]: row[2] for row in rows}
+            self._last_seq = last_seq
+            self._reloads += 1
+        self._next_reload = time.monotonic() + self.reload_interval
+
+    def _tail(self):
+        conn = acquire_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "SELECT seq, token_hash, expires_at FROM revoked_tokens WHERE seq > ? ORDER BY seq",
+                (self._last_seq - REVOCATION_TAIL_OVERLAP,)
+            )
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+            release_db_connection(conn)
+        with self._lock:
+            for seq, token_hash, expires_at in rows:
+                self._revoked[token_hash] = expires_at
+                self._last_seq = max(self._last_seq, seq)
+            self._syncs += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'revoked': len(self._revoked),
+                'last_seq': self._last_seq,
+                'checks': self._checks,
+                'rejected': self._rejected,
+                'syncs': self._syncs,
+                'reloads': self._reloads,
+                'errors': self._errors,
+                'sync_interval': self.sync_interval
+            }
+
+
+# Global instance
+revocation_list = RevocationList()
@@ -1,7 +1,6 @@
-from auth_utils import hash_password, check_password, generate_tokens, hash_token, token_required
+from auth_utils import hash_password, check_password, rehash_if_needed, generate_tokens, token_required, revoke_sessions, apply_revocations, rotate_refresh_token, create_session, PasswordHasherBusyError
 from flask import Blueprint, request, jsonify, g
 from db import get_db_connection, release_db_connection
-import datetime
 import uuid
 
 auth_bp = Blueprint('auth', __name__)
@@ -45,18 +44,10 @@ def register():
         access_token, refresh_token = generate_tokens(user_id, user_phone, 'user')
 
         # Store session
-        session_id = str(uuid.uuid4())
-        hashed_refresh = hash_token(refresh_token)
-        hashed_access = hash_token(access_token)
-        expires_at = datetime.datetime.utcnow() + datetime.timedelta(days=7)
-        
-        cursor.execute(
-            """INSERT INTO sessions (id, user_id, token_hash, refresh_token_hash, expires_at, refresh_expires_at, is_valid)
-               VALUES (?, ?, ?, ?, ?, ?, 1)""",
-            (session_id, user_id, hashed_access, hashed_refresh, expires_at, expires_at)
-        )
-        
+        # Oldest sessions beyond MAX_SESSIONS_PER_USER are revoked
+        revoked = create_session(cursor, user_id, access_token, refresh_token)
         conn.commit()
+        apply_revocations(revoked)
 
         return jsonify({
             'success': True,
@@ -96,19 +87,15 @@ def login():
         user_phone = user[1]
         user_name = user[3]
 
-        access_token, refresh_token = generate_tokens(user_id, user_phone, 'user')
+        # Upgrade the stored hash if BCRYPT_ROUNDS changed
+        rehash_if_needed(cursor, 'users', user_id, password, user[2])
 
-        session_id = str(uuid.uuid4())
-        hashed_refresh = hash_token(refresh_token)
-        hashed_access = hash_token(access_token)
-        expires_at = datetime.datetime.utcnow() + datetime.timedelta(days=7)
+        access_token, refresh_token = generate_tokens(user_id, user_phone, 'user')
 
-        cursor.execute(
-            """INSERT INTO sessions (id, user_id, token_hash, refresh_token_hash, expires_at, refresh_expires_at, is_valid)
-               VALUES (?, ?, ?, ?, ?, ?, 1)""",
-            (session_id, user_id, hashed_access, hashed_refresh, expires_at, expires_at)
-        )
+        # Oldest sessions beyond MAX_SESSIONS_PER_USER are revoked
+        revoked = create_session(cursor, user_id, access_token, refresh_token)
         conn.commit()
+        apply_revocations(revoked)
 
         return jsonify({
             'success': True,
@@ -117,6 +104,8 @@ def login():
             'user': {'id': user_id, 'phone': user_phone, 'full_name': user_name}
         })
 
+    except PasswordHasherBusyError:
+        raise  # 503 via app errorhandler
     except Exception as e:
         conn.rollback()
         print(f"Login error: {e}")
@@ -125,6 +114,58 @@ def login():
         cursor.close()
         release_db_connection(conn)
 
+@auth_bp.route('/refresh', methods=['POST'])
+def refresh():
+    """Exchange a refresh token for a new access/refresh pair (no password, no bcrypt)"""
+    data = request.get_json(silent=True) or {}
+    refresh_token = data.get('refreshToken') or data.get('refresh_token')
+
+    if not refresh_token:
+        return jsonify({'error': 'refreshToken required'}), 400
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        rotated = rotate_refresh_token(cursor, refresh_token, 'user')
+        if not rotated:
+            conn.rollback()
+            return jsonify({'error': True, 'message': 'Invalid refresh token'}), 401
+        access_token, new_refresh_token, revoked = rotated
+        conn.commit()
+        apply_revocations(revoked)
+
+        return jsonify({
+            'success': True,
+            'accessToken': access_token,
+            'refreshToken': new_refresh_token
+        })
+    except Exception as e:
+        conn.rollback()
+        print(f"Refresh error: {e}")
+        return jsonify({'error': True, 'message': 'Refresh failed'}), 500
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+@auth_bp.route('/logout', methods=['POST'])
+@token_required
+def logout():
+    """Revoke the session of the token used for this request"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        revoked = revoke_sessions(cursor, "token_hash = ?", (g.token_hash,))
+        conn.commit()
+        apply_revocations(revoked)
+        return jsonify({'success': True, 'message': 'Logged out'})
+    except Exception as e:
+        conn.rollback()
+        print(f"Logout error: {e}")
+        return jsonify({'error': True, 'message': 'Logout failed'}), 500
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
 @auth_bp.route('/change-password', methods=['POST'])
 @token_required
 def change_password():
@@ -152,6 +193,8 @@ def change_password():
         conn.commit()
         
         return jsonify({'success': True, 'message': 'Password updated successfully'})
+    except PasswordHasherBusyError:
+        raise  # 503 via app errorhandler
     except Exception as e:
         conn.rollback()
         print(f"Change Password Error: {e}")
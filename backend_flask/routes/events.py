@@ -1,6 +1,7 @@
 from flask import Blueprint, Response, g, request, jsonify
 from auth_utils import token_required
-from sse_manager import sse_manager
+from sse_manager import sse_manager, stream_channel, ListenerClosed
+import queue
 import time
 
 events_bp = Blueprint('events', __name__)
@@ -11,11 +12,22 @@ def stream():
     """
     SSE Endpoint for real-time notifications.
     Client connects here to receive updates.
+    Holds a worker thread per client; sse_server.py serves the same stream
+    from an asyncio loop for large numbers of connections.
     """
-    owner_id = g.user['sub']
+    # Owners get their files' events; users get status events for their uploads
+    owner_id = stream_channel(g.user)
+
+    # Resume point: EventSource sends Last-Event-ID on reconnect; clients that
+    # cannot set headers may pass ?last_event_id= instead
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'error': 'Invalid Last-Event-ID'}), 400
     
     def event_stream():
-        q = sse_manager.listen(owner_id)
+        q = sse_manager.listen(owner_id, last_event_id)
         try:
             # Send initial connection message
             yield "event: connected\ndata: {\"message\": \"Connected to notification stream\"}\n\n"
@@ -26,9 +38,12 @@ def stream():
                 try:
                     msg = q.get(timeout=20) 
                     yield msg
-                except Exception:
+                except queue.Empty:
                     # Timeout - just send a comment/keepalive or loop
                     yield ": keepalive\n\n"
+        except ListenerClosed:
+            # Fell too far behind (SSE_OVERFLOW_POLICY=disconnect); the client reconnects
+            sse_manager.remove_listener(owner_id, q)
         except GeneratorExit:
             # Client disconnected
             sse_manager.remove_listener(owner_id, q)
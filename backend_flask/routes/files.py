@@ -1,131 +1,159 @@
-from flask import Blueprint, request, jsonify, g
+from flask import Blueprint, request, jsonify, g, send_file
 from db import get_db_connection, release_db_connection
 from auth_utils import token_required
-from sse_manager import sse_manager
-import uuid
+from event_dispatcher import publish_file_event
+from blob_store import blob_store, release_blobs, BlobNotFoundError, BlobTooLargeError
+from werkzeug.formparser import MultiPartParser
+from werkzeug.exceptions import RequestEntityTooLarge
+from upload_utils import (
+    MAX_UPLOAD_BYTES, UPLOAD_BUFFER_SIZE, UploadValidationError, validate_upload_fields, resolve_owner_id,
+    insert_uploaded_file, publish_new_file, upload_response
+)
+from pagination import PAGE_SIZE, MAX_PAGE_SIZE, get_page_params, keyset_clause, split_page, InvalidCursorError
+from file_changes import record_change, record_deletions, fetch_changes, pruned_through, latest_seq, CHANGE_DELETE
+from etag_utils import get_version, make_etag, not_modified, with_etag
 import base64
 import datetime
+import hashlib
+import io
 import os
 
 files_bp = Blueprint('files', __name__)
 
+MAX_FORM_MEMORY_SIZE = 1024 * 1024  # Non-file fields (keys, IV, names)
+
+def _parse_streaming_upload():
+    """
+    Parse the multipart body, streaming each file part into a blob store writer
+    in UPLOAD_BUFFER_SIZE chunks. Size and SHA-256 are computed as bytes arrive.
+    Returns (form, files, writers); callers must commit or discard every writer.
+    """
+    writers = []
+
+    def stream_factory(total_content_length, content_type, filename, content_length=None):
+        writer = blob_store.writer(max_bytes=MAX_UPLOAD_BYTES, buffer_size=UPLOAD_BUFFER_SIZE)
+        writers.append(writer)
+        return writer
+
+    boundary = request.mimetype_params.get('boundary', '').encode('ascii')
+    if request.mimetype != 'multipart/form-data' or not boundary:
+        raise ValueError('Expected multipart/form-data')
+
+    parser = MultiPartParser(
+        stream_factory=stream_factory,
+        max_form_memory_size=MAX_FORM_MEMORY_SIZE,
+        buffer_size=UPLOAD_BUFFER_SIZE
+    )
+    try:
+        form, files = parser.parse(request.stream, boundary, request.content_length)
+    except Exception:
+        for writer in writers:
+            writer.discard()
+        raise
+    return form, files, writers
+
 @files_bp.route('/upload', methods=['POST'])
 @token_required  # Authentication enabled - use real user_id from JWT
 def upload_file():
-    if 'file' not in request.files:
+    try:
+        form, files, writers = _parse_streaming_upload()
+    except (BlobTooLargeError, RequestEntityTooLarge):
+        return jsonify({'error': 'File too large (max 50MB)'}), 413
+    except ValueError as e:
+        return jsonify({'error': f'Invalid upload body: {str(e)}'}), 400
+
+    try:
+        return _store_upload(form, files)
+    finally:
+        # Drop anything that was not committed (validation failure, DB error)
+        for writer in writers:
+            writer.discard()
+
+def _store_upload(form, files):
+    if 'file' not in files:
         return jsonify({'error': 'No file provided'}), 400
     
-    file = request.files['file']
-    file_name = request.form.get('file_name')
-    iv_vector_b64 = request.form.get('iv_vector')
-    auth_tag_b64 = request.form.get('auth_tag')
-    encrypted_key_b64 = request.form.get('encrypted_symmetric_key')
-    owner_id = request.form.get('owner_id')
+    file = files['file']
+    owner_id = form.get('owner_id')
 
-    if not all([file_name, iv_vector_b64, auth_tag_b64, encrypted_key_b64, owner_id]):
-        return jsonify({'error': 'Missing required fields'}), 400
-
-    # Convert Base64 to Bytes for DB storage
     try:
-        iv_vector = base64.b64decode(iv_vector_b64)
-        auth_tag = base64.b64decode(auth_tag_b64)
-        encrypted_key = base64.b64decode(encrypted_key_b64)
-        
-        # Check file size (50MB limit)
-        file.seek(0, os.SEEK_END)
-        file_length = file.tell()
-        file.seek(0)
-        
-        if file_length > 50 * 1024 * 1024: # 50MB
-            return jsonify({'error': 'File too large (max 50MB)'}), 413
-            
-        file_data = file.read()
-        file_size = len(file_data)
-        file_mime = file.content_type or 'application/octet-stream'
-        
-        # Sanitize filename (basic)
-        import re
-        file_name = re.sub(r'[^a-zA-Z0-9_.-]', '_', file_name)
-
-        # Validate file extension (Security Fix #22)
-        # Must match mobile app allowed list: pdf, doc, docx
-        allowed_extensions = {'pdf', 'doc', 'docx'}
-        ext = file_name.rsplit('.', 1)[1].lower() if '.' in file_name else ''
-        if ext not in allowed_extensions:
-            return jsonify({'error': 'Invalid file type. Only PDF and DOCX allowed.'}), 400
-        
-    except Exception as e:
-        return jsonify({'error': f'Invalid encoding: {str(e)}'}), 400
+        file_name, iv_vector, auth_tag, encrypted_key = validate_upload_fields(
+            form.get('file_name'),
+            form.get('iv_vector'),
+            form.get('auth_tag'),
+            form.get('encrypted_symmetric_key'),
+            owner_id
+        )
+    except UploadValidationError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Body was already streamed to a temp file; the 50MB limit was enforced while writing
+    writer = file.stream
+    file_size = writer.size
+    file_mime = file.content_type or 'application/octet-stream'
 
-    file_id = str(uuid.uuid4())
     user_id = g.user['sub']  # Use real user ID from JWT token
 
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    # Resolve Owner ID (Mobile app sends Email, we need UUID)
-    real_owner_id = owner_id
-    try:
-        cursor.execute("SELECT id FROM owners WHERE email = ?", (owner_id,))
-        row = cursor.fetchone()
-        if row:
-            real_owner_id = row[0]
-            print(f"Resolved owner email '{owner_id}' to UUID '{real_owner_id}'")
-        else:
-            # Check if it's already a UUID
-            cursor.execute("SELECT id FROM owners WHERE id = ?", (owner_id,))
-            if cursor.fetchone():
-                real_owner_id = owner_id
-            else:
-                print(f"Warning: Owner '{owner_id}' not found in DB. Using as-is.")
-    except Exception as e:
-        print(f"Error resolving owner: {e}")
+    real_owner_id = resolve_owner_id(cursor, owner_id)
 
+    blob_ref = None
     try:
-        created_at = datetime.datetime.utcnow().isoformat()
-        status_updated_at = created_at
-        cursor.execute(
-            """INSERT INTO files (
-                id, user_id, owner_id, file_name, encrypted_file_data, 
-                file_size_bytes, file_mime_type, iv_vector, auth_tag, 
-                encrypted_symmetric_key, created_at, is_deleted, status, status_updated_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, 'WAITING_FOR_APPROVAL', ?)""",
-            (
-                file_id, user_id, real_owner_id, file_name, file_data,
-                file_size, file_mime, iv_vector, auth_tag, encrypted_key, created_at, status_updated_at
-            )
+        # Ciphertext goes to the blob store; the row only keeps its reference
+        blob_ref = writer.commit()
+
+        file_id, created_at = insert_uploaded_file(
+            cursor, user_id, real_owner_id, file_name, blob_ref, file_size,
+            file_mime, iv_vector, auth_tag, encrypted_key
         )
         conn.commit()
 
         print(f"File uploaded: {file_id} ({file_size} bytes)")
 
-        # Notify desktop client via SSE
-        sse_manager.publish(owner_id, "new_file", {
-            "file_id": file_id,
-            "file_name": file_name,
-            "file_size_bytes": file_size,
-            "uploaded_at": created_at
-        })
+        publish_new_file(real_owner_id, file_id, file_name, file_size, created_at)
 
-        return jsonify({
-            'success': True,
-            'file_id': file_id,
-            'file_name': file_name,
-            'file_size_bytes': file_size,
-            'uploaded_at': created_at,
-            'status': 'WAITING_FOR_APPROVAL',
-            'status_updated_at': status_updated_at,
-            'message': 'File uploaded successfully. Waiting for owner approval.'
-        }), 201
+        return jsonify(upload_response(file_id, file_name, file_size, created_at)), 201
 
     except Exception as e:
         conn.rollback()
+        if blob_ref:
+            release_blobs(cursor, [blob_ref])
         print(f"Upload error: {e}")
         return jsonify({'error': True, 'message': 'Upload failed'}), 500
     finally:
         cursor.close()
         release_db_connection(conn)
 
+def _file_list_entry(row):
+    """
+    JSON for one /api/files row:
+    (id, file_name, file_size_bytes, created_at, is_printed, printed_at,
+     status, status_updated_at, rejection_reason, sender phone)
+    """
+    phone = row[9]
+    masked_phone = None
+    if phone:
+        phone_str = str(phone)
+        if len(phone_str) > 4:
+            masked_phone = 'x' * (len(phone_str) - 4) + phone_str[-4:]
+        else:
+            masked_phone = phone_str # Too short to mask
+
+    return {
+        'file_id': row[0],
+        'file_name': row[1],
+        'file_size_bytes': row[2],
+        'uploaded_at': row[3],
+        'is_printed': row[4],
+        'printed_at': row[5],
+        'status': row[6],
+        'status_updated_at': row[7],
+        'rejection_reason': row[8],
+        'sender_phone': masked_phone
+    }
+
 @files_bp.route('/files', methods=['GET'])
 @token_required
 def list_files():
@@ -133,56 +161,52 @@ def list_files():
     user_id = g.user['sub']
     role = g.user.get('role', 'user')  # Default to 'user' if role not specified
 
+    try:
+        page_size, after = get_page_params(request.args)
+    except InvalidCursorError as e:
+        return jsonify({'error': str(e)}), 400
+
     conn = get_db_connection()
     cursor = conn.cursor()
 
     try:
+        # Unchanged since the client's last poll: skip the query entirely
+        etag = make_etag(user_id, get_version(cursor, user_id))
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        # Keyset pagination: newest first, ties broken by id
+        keyset_sql, keyset_params = keyset_clause('f.created_at', 'f.id', after)
         if role == 'user':
             # Include REJECTED files even if deleted, so mobile app can show rejection status
-            query = """SELECT f.id, f.file_name, f.file_size_bytes, f.created_at, f.is_printed, f.printed_at, f.status, f.status_updated_at, f.rejection_reason, u.phone
+            query = f"""SELECT f.id, f.file_name, f.file_size_bytes, f.created_at, f.is_printed, f.printed_at, f.status, f.status_updated_at, f.rejection_reason, u.phone
                        FROM files f
                        LEFT JOIN users u ON f.user_id = u.id
-                       WHERE (f.is_deleted = 0 OR f.status = 'REJECTED') AND f.user_id = ? ORDER BY f.created_at DESC LIMIT 100"""
-            cursor.execute(query, (user_id,))
+                       WHERE (f.is_deleted = 0 OR f.status = 'REJECTED') AND f.user_id = ?{keyset_sql}
+                       ORDER BY f.created_at DESC, f.id DESC LIMIT ?"""
+            cursor.execute(query, (user_id, *keyset_params, page_size + 1))
         elif role == 'owner':
             # Include REJECTED files even if deleted, so desktop app can show rejection status
-            query = """SELECT f.id, f.file_name, f.file_size_bytes, f.created_at, f.is_printed, f.printed_at, f.status, f.status_updated_at, f.rejection_reason, u.phone
+            query = f"""SELECT f.id, f.file_name, f.file_size_bytes, f.created_at, f.is_printed, f.printed_at, f.status, f.status_updated_at, f.rejection_reason, u.phone
                        FROM files f
                        LEFT JOIN users u ON f.user_id = u.id
-                       WHERE (f.is_deleted = 0 OR f.status = 'REJECTED') AND f.owner_id = ? ORDER BY f.created_at DESC LIMIT 100"""
-            cursor.execute(query, (user_id,))
+                       WHERE (f.is_deleted = 0 OR f.status = 'REJECTED') AND f.owner_id = ?{keyset_sql}
+                       ORDER BY f.created_at DESC, f.id DESC LIMIT ?"""
+            cursor.execute(query, (user_id, *keyset_params, page_size + 1))
         else:
             return jsonify({'error': 'Invalid role'}), 403
 
-        files = []
-        for row in cursor.fetchall():
-            phone = row[9]
-            masked_phone = None
-            if phone:
-                phone_str = str(phone)
-                if len(phone_str) > 4:
-                    masked_phone = 'x' * (len(phone_str) - 4) + phone_str[-4:]
-                else:
-                    masked_phone = phone_str # Too short to mask
-            
-            files.append({
-                'file_id': row[0],
-                'file_name': row[1],
-                'file_size_bytes': row[2],
-                'uploaded_at': row[3],
-                'is_printed': row[4],
-                'printed_at': row[5],
-                'status': row[6],
-                'status_updated_at': row[7],
-                'rejection_reason': row[8],
-                'sender_phone': masked_phone 
-            })
+        rows, next_cursor = split_page(cursor.fetchall(), page_size, sort_index=3, id_index=0)
 
-        return jsonify({
+        files = [_file_list_entry(row) for row in rows]
+
+        return with_etag(jsonify({
             'success': True,
             'count': len(files),
-            'files': files
-        })
+            'files': files,
+            'next_cursor': next_cursor
+        }), etag)
 
     except Exception as e:
         print(f"List files error: {e}")
@@ -191,6 +215,91 @@ def list_files():
         cursor.close()
         release_db_connection(conn)
 
+@files_bp.route('/files/changes', methods=['GET'])
+@token_required
+def list_file_changes():
+    """
+    Delta sync: files inserted, updated or deleted after ?since=<seq>.
+    Each file appears once with its current state, or as a tombstone
+    ({"deleted": true}) if it is gone. Clients store next_since and poll again
+    with it; has_more means another page is waiting. resync means `since` is
+    older than the retained change log: re-fetch the full listing, then poll
+    from the returned next_since.
+    """
+    role = g.user.get('role', 'user')
+    if role not in ('user', 'owner'):
+        return jsonify({'error': 'Invalid role'}), 403
+    column = 'owner_id' if role == 'owner' else 'user_id'
+
+    try:
+        since = int(request.args.get('since', 0))
+        limit = min(int(request.args.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'since and limit must be integers'}), 400
+    if since < 0 or limit < 1:
+        return jsonify({'error': 'since must be >= 0 and limit positive'}), 400
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        if since < pruned_through(cursor):
+            return jsonify({
+                'success': True,
+                'resync': True,
+                'count': 0,
+                'changes': [],
+                'next_since': latest_seq(cursor),
+                'has_more': False
+            })
+
+        change_rows = fetch_changes(cursor, column, g.user['sub'], since, limit)
+        has_more = len(change_rows) > limit
+        change_rows = change_rows[:limit]
+
+        # Collapse to the latest change per file, in sequence order
+        latest = {}
+        for seq, file_id, change_type in change_rows:
+            latest.pop(file_id, None)
+            latest[file_id] = (seq, change_type)
+
+        live_ids = [fid for fid, (_, change_type) in latest.items() if change_type != CHANGE_DELETE]
+        current = {}
+        if live_ids:
+            placeholders = ', '.join('?' * len(live_ids))
+            cursor.execute(f"""SELECT f.id, f.file_name, f.file_size_bytes, f.created_at, f.is_printed, f.printed_at, f.status, f.status_updated_at, f.rejection_reason, u.phone
+                       FROM files f
+                       LEFT JOIN users u ON f.user_id = u.id
+                       WHERE (f.is_deleted = 0 OR f.status = 'REJECTED') AND f.{column} = ? AND f.id IN ({placeholders})""",
+                           (g.user['sub'], *live_ids))
+            current = {row[0]: row for row in cursor.fetchall()}
+
+        changes = []
+        for file_id, (seq, change_type) in latest.items():
+            row = current.get(file_id)
+            if row is None:
+                # Deleted, or deleted by a later change not in this page
+                changes.append({'seq': seq, 'file_id': file_id, 'deleted': True})
+            else:
+                changes.append({'seq': seq, 'file_id': file_id, 'deleted': False,
+                                'file': _file_list_entry(row)})
+
+        return jsonify({
+            'success': True,
+            'count': len(changes),
+            'resync': False,
+            'changes': changes,
+            'next_since': change_rows[-1][0] if change_rows else since,
+            'has_more': has_more
+        })
+
+    except Exception as e:
+        print(f"List changes error: {e}")
+        return jsonify({'error': True, 'message': 'Failed to list changes'}), 500
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
 @files_bp.route('/print/<file_id>', methods=['GET'])
 @token_required
 def get_file_for_print(file_id):
@@ -204,7 +313,7 @@ def get_file_for_print(file_id):
         cursor.execute("""
             SELECT id, file_name, encrypted_file_data, file_size_bytes, 
                    iv_vector, auth_tag, encrypted_symmetric_key, created_at, 
-                   is_printed, owner_id
+                   is_printed, owner_id, blob_ref
             FROM files WHERE id = ? AND is_deleted = 0
         """, (file_id,))
         
@@ -221,11 +330,14 @@ def get_file_for_print(file_id):
                 data = data.tobytes()
             return base64.b64encode(data).decode('utf-8')
 
+        # Rows uploaded before the blob store keep their ciphertext inline
+        encrypted_data = blob_store.read(row[10]) if row[10] else row[2]
+
         response = {
             'success': True,
             'file_id': row[0],
             'file_name': row[1],
-            'encrypted_file_data': to_b64(row[2]),
+            'encrypted_file_data': to_b64(encrypted_data),
             'file_size_bytes': row[3],
             'iv_vector': to_b64(row[4]),
             'auth_tag': to_b64(row[5]),
@@ -236,6 +348,9 @@ def get_file_for_print(file_id):
         }
         return jsonify(response)
 
+    except BlobNotFoundError as e:
+        print(f"Print download error: {e}")
+        return jsonify({'error': True, 'message': 'File data missing'}), 410
     except Exception as e:
         print(f"Print download error: {e}")
         return jsonify({'error': True, 'message': 'Failed to download'}), 500
@@ -243,6 +358,86 @@ def get_file_for_print(file_id):
         cursor.close()
         release_db_connection(conn)
 
+@files_bp.route('/print/<file_id>/raw', methods=['GET'])
+@token_required
+def get_raw_file_for_print(file_id):
+    """
+    Binary variant of /print/<file_id>: the ciphertext is the response body
+    (application/octet-stream) and the decryption metadata travels in headers.
+    Supports Range / If-Range for resuming and If-None-Match against the
+    ciphertext SHA-256, so interrupted downloads do not start over.
+    """
+    if g.user['role'] != 'owner':
+        return jsonify({'error': 'Forbidden'}), 403
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("""
+            SELECT id, file_name, blob_ref, file_size_bytes,
+                   iv_vector, auth_tag, encrypted_symmetric_key, owner_id
+            FROM files WHERE id = ? AND is_deleted = 0
+        """, (file_id,))
+
+        row = cursor.fetchone()
+        if not row:
+            return jsonify({'error': 'File not found'}), 404
+
+        if str(row[7]) != g.user['sub']:
+            return jsonify({'error': 'Forbidden: Not your file'}), 403
+
+        blob_ref = row[2]
+        if blob_ref:
+            path = blob_store.local_path(blob_ref)
+            if path:
+                # Disk-backed: werkzeug serves it through wsgi.file_wrapper / X-Sendfile
+                if not os.path.exists(path):
+                    raise BlobNotFoundError(f"Blob not found: {blob_ref}")
+                body = path
+            else:
+                body = blob_store.open(blob_ref)
+            etag = blob_ref
+        else:
+            # Legacy row with inline ciphertext
+            cursor.execute("SELECT encrypted_file_data FROM files WHERE id = ?", (file_id,))
+            data = bytes(cursor.fetchone()[0])
+            body = io.BytesIO(data)
+            etag = hashlib.sha256(data).hexdigest()
+
+        response = send_file(
+            body,
+            mimetype='application/octet-stream',
+            as_attachment=True,
+            download_name=f"{row[1]}.enc",
+            conditional=True,
+            etag=etag
+        )
+        response.cache_control.private = True
+
+        def to_b64(data):
+            if isinstance(data, memoryview):
+                data = data.tobytes()
+            return base64.b64encode(data).decode('utf-8')
+
+        response.headers['X-File-Id'] = row[0]
+        response.headers['X-File-Name'] = row[1]
+        response.headers['X-File-Size'] = str(row[3])
+        response.headers['X-IV-Vector'] = to_b64(row[4])
+        response.headers['X-Auth-Tag'] = to_b64(row[5])
+        response.headers['X-Encrypted-Symmetric-Key'] = to_b64(row[6])
+        return response
+
+    except BlobNotFoundError as e:
+        print(f"Raw print download error: {e}")
+        return jsonify({'error': True, 'message': 'File data missing'}), 410
+    except Exception as e:
+        print(f"Raw print download error: {e}")
+        return jsonify({'error': True, 'message': 'Failed to download'}), 500
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
 @files_bp.route('/delete/<file_id>', methods=['POST'])
 @token_required
 def delete_file(file_id):
@@ -254,7 +449,7 @@ def delete_file(file_id):
 
     try:
         # Verify ownership - either owner OR the user who uploaded it
-        cursor.execute("SELECT user_id, owner_id, is_deleted, status, file_name FROM files WHERE id = ?", (file_id,))
+        cursor.execute("SELECT user_id, owner_id, is_deleted, status, file_name, blob_ref FROM files WHERE id = ?", (file_id,))
         row = cursor.fetchone()
         if not row:
              return jsonify({'error': 'File not found'}), 404
@@ -277,6 +472,7 @@ def delete_file(file_id):
 
         current_status = row[3]
         file_name = row[4]
+        blob_ref = row[5]
 
         # Mark as deleted
         deleted_at = datetime.datetime.utcnow().isoformat()
@@ -301,13 +497,15 @@ def delete_file(file_id):
             final_status = 'CANCELLED'
             cursor.execute("DELETE FROM files WHERE id = ?", (file_id,))
             print(f"File PERMANENTLY deleted (Hard Delete), status changed from {current_status} to CANCELLED")
-        
+
+        record_change(cursor, file_id, file_owner_id, file_user_id, CHANGE_DELETE, final_status)
         conn.commit()
+        release_blobs(cursor, [blob_ref])
 
-        # Notify via SSE (notify the owner, not the user)
+        # Notify via SSE (the owner and the uploading user)
         # Note: We notify BEFORE returning, but since it's deleted, future fetches won't find it.
         try:
-            sse_manager.publish(file_owner_id, "status_update", {
+            publish_file_event(file_owner_id, file_user_id, "status_update", {
                 "file_id": file_id,
                 "file_name": file_name,
                 "status": final_status,
@@ -340,22 +538,35 @@ def get_print_history():
     if g.user['role'] != 'owner':
         return jsonify({'error': 'Forbidden'}), 403
 
+    try:
+        page_size, after = get_page_params(request.args)
+    except InvalidCursorError as e:
+        return jsonify({'error': str(e)}), 400
+
     conn = get_db_connection()
     cursor = conn.cursor()
 
     try:
-        # Get all deleted files for this owner
-        cursor.execute("""
+        etag = make_etag(g.user['sub'], get_version(cursor, g.user['sub']))
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        # Deleted files for this owner, most recently deleted first
+        keyset_sql, keyset_params = keyset_clause('deleted_at', 'id', after)
+        cursor.execute(f"""
             SELECT id, file_name, file_size_bytes, created_at, deleted_at, 
                    status, status_updated_at, rejection_reason, is_printed
             FROM files 
-            WHERE is_deleted = 1 AND owner_id = ? 
-            ORDER BY deleted_at DESC 
-            LIMIT 100
-        """, (g.user['sub'],))
+            WHERE is_deleted = 1 AND owner_id = ?{keyset_sql}
+            ORDER BY deleted_at DESC, id DESC 
+            LIMIT ?
+        """, (g.user['sub'], *keyset_params, page_size + 1))
+
+        rows, next_cursor = split_page(cursor.fetchall(), page_size, sort_index=4, id_index=0)
 
         history = []
-        for row in cursor.fetchall():
+        for row in rows:
             history.append({
                 'file_id': row[0],
                 'file_name': row[1],
@@ -368,11 +579,12 @@ def get_print_history():
                 'is_printed': row[8]
             })
 
-        return jsonify({
+        return with_etag(jsonify({
             'success': True,
             'count': len(history),
-            'history': history
-        })
+            'history': history,
+            'next_cursor': next_cursor
+        }), etag)
 
     except Exception as e:
         print(f"History error: {e}")
@@ -391,7 +603,14 @@ def clear_history():
     cursor = conn.cursor()
 
     try:
+        cursor.execute("""
+            SELECT blob_ref FROM files
+            WHERE is_deleted = 1 AND owner_id = ? AND blob_ref IS NOT NULL
+        """, (g.user['sub'],))
+        blob_refs = [row[0] for row in cursor.fetchall()]
+
         # Permanently delete all deleted files for this owner
+        record_deletions(cursor, "is_deleted = 1 AND owner_id = ?", (g.user['sub'],))
         cursor.execute("""
             DELETE FROM files 
             WHERE is_deleted = 1 AND owner_id = ?
@@ -399,6 +618,7 @@ def clear_history():
         
         deleted_count = cursor.rowcount
         conn.commit()
+        release_blobs(cursor, blob_refs)
         
         print(f"Permanently deleted {deleted_count} history records for owner {g.user['sub']}")
 
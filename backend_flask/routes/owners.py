@@ -1,13 +1,19 @@
-from auth_utils import hash_password, check_password, generate_tokens, hash_token, token_required
+from auth_utils import hash_password, check_password, rehash_if_needed, generate_tokens, hash_token, token_required, revoke_sessions, apply_revocations, rotate_refresh_token, create_session, PasswordHasherBusyError
 from flask import Blueprint, request, jsonify, g
 from db import get_db_connection, release_db_connection
-import datetime
+from blob_store import release_blobs
+from file_changes import record_deletions
+from google_tokens import google_token_verifier, GoogleKeysUnavailableError
+from http_client import http_client
+from oauth_store import oauth_store
+import jwt
 import uuid
 import requests
 import os
 import json
 import base64
 import time
+import math
 from urllib.parse import urlencode
 
 owners_bp = Blueprint('owners', __name__)
@@ -54,18 +60,10 @@ def register():
 
         access_token, refresh_token = generate_tokens(owner_id, owner_email, 'owner')
 
-        session_id = str(uuid.uuid4())
-        hashed_refresh = hash_token(refresh_token)
-        hashed_access = hash_token(access_token)
-        expires_at = datetime.datetime.utcnow() + datetime.timedelta(days=7)
-        
-        cursor.execute(
-            """INSERT INTO sessions (id, user_id, token_hash, refresh_token_hash, expires_at, refresh_expires_at, is_valid)
-               VALUES (?, ?, ?, ?, ?, ?, 1)""",
-            (session_id, owner_id, hashed_access, hashed_refresh, expires_at, expires_at)
-        )
-        
+        # Oldest sessions beyond MAX_SESSIONS_PER_USER are revoked
+        revoked = create_session(cursor, owner_id, access_token, refresh_token)
         conn.commit()
+        apply_revocations(revoked)
 
         return jsonify({
             'success': True,
@@ -106,6 +104,9 @@ def login():
         owner_email = owner[1]
         owner_name = owner[3]
 
+        # Upgrade the stored hash if BCRYPT_ROUNDS changed
+        rehash_if_needed(cursor, 'owners', owner_id, password, owner[2])
+
         # Update public key if provided (for key sync)
         if public_key:
             cursor.execute("UPDATE owners SET public_key = ? WHERE id = ?", (public_key, owner_id))
@@ -113,17 +114,10 @@ def login():
 
         access_token, refresh_token = generate_tokens(owner_id, owner_email, 'owner')
 
-        session_id = str(uuid.uuid4())
-        hashed_refresh = hash_token(refresh_token)
-        hashed_access = hash_token(access_token)
-        expires_at = datetime.datetime.utcnow() + datetime.timedelta(days=7)
-
-        cursor.execute(
-            """INSERT INTO sessions (id, user_id, token_hash, refresh_token_hash, expires_at, refresh_expires_at, is_valid)
-               VALUES (?, ?, ?, ?, ?, ?, 1)""",
-            (session_id, owner_id, hashed_access, hashed_refresh, expires_at, expires_at)
-        )
+        # Oldest sessions beyond MAX_SESSIONS_PER_USER are revoked
+        revoked = create_session(cursor, owner_id, access_token, refresh_token)
         conn.commit()
+        apply_revocations(revoked)
 
         return jsonify({
             'success': True,
@@ -132,6 +126,8 @@ def login():
             'owner': {'id': owner_id, 'email': owner_email, 'full_name': owner_name}
         })
 
+    except PasswordHasherBusyError:
+        raise  # 503 via app errorhandler
     except Exception as e:
         conn.rollback()
         print(f"Owner Login error: {e}")
@@ -140,6 +136,58 @@ def login():
         cursor.close()
         release_db_connection(conn)
 
+@owners_bp.route('/refresh', methods=['POST'])
+def refresh():
+    """Exchange a refresh token for a new access/refresh pair (no password, no bcrypt)"""
+    data = request.get_json(silent=True) or {}
+    refresh_token = data.get('refreshToken') or data.get('refresh_token')
+
+    if not refresh_token:
+        return jsonify({'error': 'refreshToken required'}), 400
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        rotated = rotate_refresh_token(cursor, refresh_token, 'owner')
+        if not rotated:
+            conn.rollback()
+            return jsonify({'error': True, 'message': 'Invalid refresh token'}), 401
+        access_token, new_refresh_token, revoked = rotated
+        conn.commit()
+        apply_revocations(revoked)
+
+        return jsonify({
+            'success': True,
+            'accessToken': access_token,
+            'refreshToken': new_refresh_token
+        })
+    except Exception as e:
+        conn.rollback()
+        print(f"Owner Refresh error: {e}")
+        return jsonify({'error': True, 'message': 'Refresh failed'}), 500
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+@owners_bp.route('/logout', methods=['POST'])
+@token_required
+def logout():
+    """Revoke the session of the token used for this request"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        revoked = revoke_sessions(cursor, "token_hash = ?", (g.token_hash,))
+        conn.commit()
+        apply_revocations(revoked)
+        return jsonify({'success': True, 'message': 'Logged out'})
+    except Exception as e:
+        conn.rollback()
+        print(f"Owner Logout error: {e}")
+        return jsonify({'error': True, 'message': 'Logout failed'}), 500
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
 @owners_bp.route('/profile', methods=['GET'])
 @token_required
 def get_profile():
@@ -308,6 +356,8 @@ def change_password():
         conn.commit()
         
         return jsonify({'success': True, 'message': 'Password updated successfully'})
+    except PasswordHasherBusyError:
+        raise  # 503 via app errorhandler
     except Exception as e:
         conn.rollback()
         print(f"Change Password Error: {e}")
@@ -422,8 +472,13 @@ def delete_account():
     try:
         owner_id = g.user['sub']
         
-        # Delete related data
+        cursor.execute("SELECT blob_ref FROM files WHERE owner_id = ? AND blob_ref IS NOT NULL", (owner_id,))
+        blob_refs = [row[0] for row in cursor.fetchall()]
+
+        # Delete related data (uploaders see tombstones on their next delta sync)
+        record_deletions(cursor, "owner_id = ?", (owner_id,))
         cursor.execute("DELETE FROM files WHERE owner_id = ?", (owner_id,))
+        revoked = revoke_sessions(cursor, "user_id = ?", (owner_id,))
         cursor.execute("DELETE FROM sessions WHERE user_id = ?", (owner_id,))
         
         try:
@@ -433,9 +488,12 @@ def delete_account():
         
         # Delete owner
         cursor.execute("DELETE FROM owners WHERE id = ?", (owner_id,))
+        owner_deleted = cursor.rowcount
         conn.commit()
+        apply_revocations(revoked)
+        release_blobs(cursor, blob_refs)
         
-        if cursor.rowcount == 0:
+        if owner_deleted == 0:
             return jsonify({'error': True, 'message': 'Account not found'}), 404
             
         print(f"DEBUG: Deleted account for owner {owner_id}")
@@ -453,23 +511,13 @@ def delete_account():
 # Browser-based Google OAuth Routes
 # ============================================
 
-# In-memory storage for pending desktop auth sessions
-# Format: {session_id: {'status': 'pending'|'success', 'jwt': ..., 'user': ..., 'created_at': ...}}
-oauth_sessions = {}
-
-def _cleanup_oauth_sessions():
-    """Remove expired sessions (older than 5 minutes)"""
-    now = time.time()
-    expired = [sid for sid, data in oauth_sessions.items() 
-               if now - data.get('created_at', 0) > 300]
-    for sid in expired:
-        del oauth_sessions[sid]
+# Longest a /google/status request may wait for the sign-in to finish
+OAUTH_STATUS_MAX_WAIT = float(os.getenv('OAUTH_STATUS_MAX_WAIT', 25))
 
 @owners_bp.route('/google/login', methods=['GET'])
 def google_login():
     print("BASE_URL USED FOR GOOGLE LOGIN =", BASE_URL)
     """Redirect user to Google OAuth consent page"""
-    _cleanup_oauth_sessions()
     
     client_id = os.getenv('GOOGLE_CLIENT_ID')
     redirect_uri = f"{BASE_URL}/api/owners/google/callback"
@@ -484,11 +532,8 @@ def google_login():
         # Fallback to desktop_session or generate new one
         session_id = request.args.get('desktop_session', str(uuid.uuid4()))
     
-    # Store pending session
-    oauth_sessions[session_id] = {
-        'status': 'pending',
-        'created_at': time.time()
-    }
+    # Store pending session (shared by all workers)
+    oauth_store.create(session_id)
     print(f"DEBUG: Initialized OAuth session {session_id}")
     
     # Encode state: {session_id, nonce, timestamp}
@@ -517,33 +562,37 @@ def google_login():
 
 @owners_bp.route('/google/status', methods=['GET'])
 def google_status():
-    """Poll for desktop OAuth completion"""
-    _cleanup_oauth_sessions()
-    
+    """
+    Desktop OAuth completion. With ?wait=<seconds> the request is held until
+    the callback finishes (or the wait runs out), so one request replaces a
+    polling loop.
+    """
     session_id = request.args.get('session_id', '').strip()
-    print(f"DEBUG: Status check for [{session_id}]")
+    try:
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        return jsonify({'error': 'Invalid wait'}), 400
+    # nan would never reach the deadline and hold the worker forever
+    if not math.isfinite(wait):
+        return jsonify({'error': 'Invalid wait'}), 400
+    wait = min(max(wait, 0), OAUTH_STATUS_MAX_WAIT)
+    print(f"DEBUG: Status check for [{session_id}] (wait={wait})")
     
-    if not session_id or session_id not in oauth_sessions:
-        print(f"DEBUG: Session [{session_id}] not found. Active: {list(oauth_sessions.keys())}")
+    if not session_id:
         return jsonify({'status': 'pending'})
     
-    session_data = oauth_sessions[session_id]
-    print(f"DEBUG: Session [{session_id}] data: status={session_data.get('status')}")
-    
-    if session_data.get('status') == 'success':
-        print(f"DEBUG: Returning success for [{session_id}]")
-        # Return auth data and clean up
-        user_data = session_data.get('user', {})
-        result = {
-            'status': 'success',
-            'jwt': session_data.get('jwt'),
-            'email': user_data.get('email'),
-            'name': user_data.get('name') or user_data.get('full_name')
-        }
-        del oauth_sessions[session_id]
-        return jsonify(result)
+    session_data = oauth_store.wait(session_id, wait) if wait else oauth_store.take(session_id)
+    if session_data is None:
+        return jsonify({'status': 'pending'})
     
-    return jsonify({'status': 'pending'})
+    print(f"DEBUG: Returning success for [{session_id}]")
+    user_data = session_data.get('user', {})
+    return jsonify({
+        'status': 'success',
+        'jwt': session_data.get('jwt'),
+        'email': user_data.get('email'),
+        'name': user_data.get('name') or user_data.get('full_name')
+    })
 
 
 @owners_bp.route('/google/callback', methods=['GET'])
@@ -576,8 +625,8 @@ def google_callback():
         print(f"DEBUG: State decode failed: {e}")
         return f"Invalid session state: {str(e)}", 400
         
-    if not session_id or session_id not in oauth_sessions:
-        print(f"DEBUG: Session [{session_id}] not found in callback. Active: {list(oauth_sessions.keys())}")
+    if not session_id or not oauth_store.exists(session_id):
+        print(f"DEBUG: Session [{session_id}] not found in callback")
         return "Session expired or invalid. Please try again from the app.", 400
     
     client_id = os.getenv('GOOGLE_CLIENT_ID')
@@ -588,8 +637,8 @@ def google_callback():
         return "Google OAuth not configured on server", 500
     
     try:
-        # Exchange code for tokens
-        token_response = requests.post(
+        # Exchange code for tokens (pooled connection, bounded timeouts)
+        token_response = http_client.post(
             'https://oauth2.googleapis.com/token',
             data={
                 'code': code,
@@ -606,14 +655,15 @@ def google_callback():
         tokens = token_response.json()
         id_token = tokens.get('id_token')
         
-        # Verify and decode ID token
-        verify_url = f"https://oauth2.googleapis.com/tokeninfo?id_token={id_token}"
-        verify_response = requests.get(verify_url)
-        
-        if verify_response.status_code != 200:
+        # Verify and decode ID token locally against Google's cached signing keys
+        try:
+            token_info = google_token_verifier.verify(id_token or '', client_id)
+        except jwt.InvalidTokenError as e:
+            print(f"DEBUG: Google ID token rejected: {e}")
             return "Invalid token from Google", 401
+        except GoogleKeysUnavailableError:
+            return "Google sign-in is temporarily unavailable. Please try again.", 503
         
-        token_info = verify_response.json()
         email = token_info.get('email')
         name = token_info.get('name', email.split('@')[0] if email else 'User')
         
@@ -639,13 +689,18 @@ def google_callback():
         # Create JWT session
         access_token, refresh_token = generate_tokens(owner_id, email, 'owner')
         
-        # Store in shared storage for polling
-        oauth_sessions[session_id] = {
-            'status': 'success',
+        # Stored before the token is handed out, so logout and the session cap
+        # can revoke it; oldest sessions beyond MAX_SESSIONS_PER_USER are revoked
+        revoked = create_session(cursor, owner_id, access_token, refresh_token)
+        conn.commit()
+        apply_revocations(revoked)
+        
+        # Hand the result to /google/status (any worker)
+        if not oauth_store.complete(session_id, {
             'jwt': access_token,
-            'user': {'id': owner_id, 'email': email, 'full_name': owner_name, 'name': owner_name},
-            'created_at': time.time()
-        }
+            'user': {'id': owner_id, 'email': email, 'full_name': owner_name, 'name': owner_name}
+        }):
+            return "Session expired or invalid. Please try again from the app.", 400
         print(f"DEBUG: Updated session {session_id} to success")
         
         # Return minimal success HTML
@@ -670,6 +725,9 @@ def google_callback():
         </html>
         """, 200
         
+    except requests.exceptions.RequestException as e:
+        print(f"DEBUG: Google token exchange failed: {e}")
+        return "Google sign-in is temporarily unavailable. Please try again.", 503
     except Exception as e:
         print(f"DEBUG: Google Callback Error: {e}")
         return f"Authentication failed: {str(e)}", 500
@@ -692,19 +750,16 @@ def google_auth():
         if not id_token:
             return jsonify({'error': 'id_token required'}), 400
             
-        # Verify token with Google
-        verify_url = f"https://oauth2.googleapis.com/tokeninfo?id_token={id_token}"
-        response = requests.get(verify_url)
-        
-        if response.status_code != 200:
-            return jsonify({'error': 'Invalid token'}), 401
-            
-        token_info = response.json()
-        
-        # Verify Audience
+        # Verify token locally (signature, expiry, issuer, audience)
         client_id = os.getenv('GOOGLE_CLIENT_ID')
-        if token_info.get('aud') != client_id:
+        try:
+            token_info = google_token_verifier.verify(id_token, client_id)
+        except jwt.InvalidAudienceError:
             return jsonify({'error': 'Invalid token audience'}), 401
+        except jwt.InvalidTokenError:
+            return jsonify({'error': 'Invalid token'}), 401
+        except GoogleKeysUnavailableError:
+            return jsonify({'error': True, 'message': 'Google sign-in temporarily unavailable'}), 503
             
         # Extract Email
         email = token_info.get('email')
@@ -727,17 +782,10 @@ def google_auth():
         # Create Session (Login)
         access_token, refresh_token = generate_tokens(owner_id, email, 'owner')
         
-        session_id = str(uuid.uuid4())
-        hashed_refresh = hash_token(refresh_token)
-        hashed_access = hash_token(access_token)
-        expires_at = datetime.datetime.utcnow() + datetime.timedelta(days=7)
-        
-        cursor.execute(
-            """INSERT INTO sessions (id, user_id, token_hash, refresh_token_hash, expires_at, refresh_expires_at, is_valid)
-               VALUES (?, ?, ?, ?, ?, ?, 1)""",
-            (session_id, owner_id, hashed_access, hashed_refresh, expires_at, expires_at)
-        )
+        # Oldest sessions beyond MAX_SESSIONS_PER_USER are revoked
+        revoked = create_session(cursor, owner_id, access_token, refresh_token)
         conn.commit()
+        apply_revocations(revoked)
         
         return jsonify({
             'success': True,
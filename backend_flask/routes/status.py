@@ -1,7 +1,9 @@
 from flask import Blueprint, request, jsonify, g
 from db import get_db_connection, release_db_connection
 from auth_utils import token_required
-from sse_manager import sse_manager
+from event_dispatcher import publish_file_event
+from file_changes import record_change, CHANGE_STATUS
+from etag_utils import get_version, make_etag, not_modified, with_etag
 import datetime
 
 status_bp = Blueprint('status', __name__)
@@ -86,13 +88,14 @@ def update_file_status(file_id):
                 SET status = ?, status_updated_at = ?, rejection_reason = ?
                 WHERE id = ?
             """, (new_status, status_updated_at, rejection_reason, file_id))
-        
+
+        record_change(cursor, file_id, str(file_row[0]), user_id, CHANGE_STATUS, new_status)
         conn.commit()
         
         print(f"✅ Status updated for file {file_id}: {current_status} → {new_status}")
         
-        # Notify desktop owner (if applicable)
-        sse_manager.publish(str(file_row[0]), "status_update", {
+        # Notify the desktop owner and the uploading user's devices
+        publish_file_event(str(file_row[0]), user_id, "status_update", {
             "file_id": file_id,
             "file_name": file_name,
             "status": new_status,
@@ -151,7 +154,14 @@ def get_file_status(file_id):
         elif user_role == 'owner' and str(file_row[7]) != user_sub:
             return jsonify({'error': 'Forbidden'}), 403
         
-        return jsonify({
+        # After the access checks, so a 304 never stands in for a 403/404.
+        # Any change to the caller's files bumps their version.
+        etag = make_etag(user_sub, get_version(cursor, user_sub))
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
+        return with_etag(jsonify({
             'success': True,
             'file_id': file_row[0],
             'file_name': file_row[1],
@@ -159,7 +169,7 @@ def get_file_status(file_id):
             'status_updated_at': file_row[3],
             'rejection_reason': file_row[4],
             'uploaded_at': file_row[5]
-        }), 200
+        }), etag)
         
     except Exception as e:
         print(f"Get status error: {e}")
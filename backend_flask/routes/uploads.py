@@ -0,0 +1,376 @@
+from flask import Blueprint, request, jsonify, g
+from db import get_db_connection, release_db_connection
+from auth_utils import token_required
+from blob_store import blob_store, release_blobs
+from werkzeug.exceptions import ClientDisconnected
+from upload_utils import (
+    MAX_UPLOAD_BYTES, UPLOAD_BUFFER_SIZE, UploadValidationError, validate_upload_fields,
+    resolve_owner_id, insert_uploaded_file, publish_new_file, upload_response
+)
+import datetime
+import json
+import os
+import re
+import uuid
+
+uploads_bp = Blueprint('uploads', __name__)
+
+# Resumable upload configuration
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 1024 * 1024))  # Suggested to clients
+UPLOAD_MAX_CHUNK_BYTES = int(os.getenv('UPLOAD_MAX_CHUNK_BYTES', 8 * 1024 * 1024))
+UPLOAD_SESSION_TTL_HOURS = int(os.getenv('UPLOAD_SESSION_TTL_HOURS', 24))
+
+# Optimistic-lock retries when several chunks of one session land at once
+RANGE_UPDATE_RETRIES = 5
+
+SESSION_COLUMNS = """id, user_id, owner_id, file_name, file_mime_type, iv_vector, auth_tag,
+                     encrypted_symmetric_key, total_size, received_ranges, bytes_received,
+                     status, version, expires_at"""
+
+
+def _now():
+    return datetime.datetime.utcnow()
+
+
+def _expiry():
+    return (_now() + datetime.timedelta(hours=UPLOAD_SESSION_TTL_HOURS)).isoformat()
+
+
+def _merge_range(ranges, start, end):
+    """Add [start, end) to a sorted list of disjoint ranges, merging neighbours"""
+    merged = []
+    for r_start, r_end in sorted(ranges + [[start, end]]):
+        if merged and r_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], r_end)
+        else:
+            merged.append([r_start, r_end])
+    return merged
+
+
+def _missing_ranges(ranges, total_size):
+    missing = []
+    position = 0
+    for r_start, r_end in ranges:
+        if r_start > position:
+            missing.append([position, r_start])
+        position = max(position, r_end)
+    if position < total_size:
+        missing.append([position, total_size])
+    return missing
+
+
+def _session_status(row, ranges=None, bytes_received=None, expires_at=None):
+    ranges = ranges if ranges is not None else json.loads(row[9])
+    missing = _missing_ranges(ranges, row[8])
+    return {
+        'success': True,
+        'upload_id': row[0],
+        'file_name': row[3],
+        'total_size': row[8],
+        'bytes_received': bytes_received if bytes_received is not None else row[10],
+        'received_ranges': ranges,
+        'missing_ranges': missing,
+        'complete': not missing,
+        'expires_at': expires_at or row[13]
+    }
+
+
+def _load_session(cursor, upload_id):
+    """Fetch a live session owned by the caller. Returns (row, error_response)."""
+    cursor.execute(f"SELECT {SESSION_COLUMNS} FROM upload_sessions WHERE id = ?", (upload_id,))
+    row = cursor.fetchone()
+    if not row or row[13] < _now().isoformat():
+        return None, (jsonify({'error': 'Upload session not found or expired'}), 404)
+    if str(row[1]) != g.user['sub']:
+        return None, (jsonify({'error': 'Forbidden: Not your upload'}), 403)
+    return row, None
+
+
+def _discard_session(cursor, upload_id):
+    cursor.execute("DELETE FROM upload_sessions WHERE id = ?", (upload_id,))
+    try:
+        os.remove(blob_store.staging_path(upload_id))
+    except FileNotFoundError:
+        pass
+
+
+def _cleanup_expired_sessions(cursor):
+    """Remove expired sessions and their partial files"""
+    cursor.execute("SELECT id FROM upload_sessions WHERE expires_at < ?", (_now().isoformat(),))
+    for row in cursor.fetchall():
+        _discard_session(cursor, row[0])
+
+
+def _chunk_offset():
+    """Chunk offset from ?offset=N or a 'Content-Range: bytes start-end/total' header"""
+    if 'offset' in request.args:
+        try:
+            return int(request.args['offset'])
+        except ValueError:
+            return None
+    match = re.match(r'bytes (\d+)-\d+/\d+', request.headers.get('Content-Range', ''))
+    return int(match.group(1)) if match else None
+
+
+@uploads_bp.route('', methods=['POST'])
+@token_required
+def create_upload():
+    """
+    Start a resumable upload.
+    Request body: same fields as /api/upload (minus the file) plus "total_size"
+    """
+    data = request.get_json() or {}
+    owner_id = data.get('owner_id')
+
+    try:
+        file_name, iv_vector, auth_tag, encrypted_key = validate_upload_fields(
+            data.get('file_name'),
+            data.get('iv_vector'),
+            data.get('auth_tag'),
+            data.get('encrypted_symmetric_key'),
+            owner_id
+        )
+    except UploadValidationError as e:
+        return jsonify({'error': str(e)}), 400
+
+    total_size = data.get('total_size')
+    if not isinstance(total_size, int) or total_size <= 0:
+        return jsonify({'error': 'total_size must be a positive integer'}), 400
+    if total_size > MAX_UPLOAD_BYTES:
+        return jsonify({'error': 'File too large (max 50MB)'}), 413
+
+    upload_id = str(uuid.uuid4())
+    expires_at = _expiry()
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        _cleanup_expired_sessions(cursor)
+
+        # Sparse file of the final size; chunks are written in place at their offsets
+        with open(blob_store.staging_path(upload_id), 'wb') as f:
+            f.truncate(total_size)
+
+        cursor.execute(
+            """INSERT INTO upload_sessions (
+                id, user_id, owner_id, file_name, file_mime_type, iv_vector, auth_tag,
+                encrypted_symmetric_key, total_size, expires_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (
+                upload_id, g.user['sub'], owner_id, file_name,
+                data.get('file_mime_type') or 'application/octet-stream',
+                iv_vector, auth_tag, encrypted_key, total_size, expires_at
+            )
+        )
+        conn.commit()
+
+        return jsonify({
+            'success': True,
+            'upload_id': upload_id,
+            'total_size': total_size,
+            'chunk_size': UPLOAD_CHUNK_SIZE,
+            'max_chunk_size': UPLOAD_MAX_CHUNK_BYTES,
+            'expires_at': expires_at
+        }), 201
+
+    except Exception as e:
+        conn.rollback()
+        try:
+            os.remove(blob_store.staging_path(upload_id))
+        except FileNotFoundError:
+            pass
+        print(f"Create upload error: {e}")
+        return jsonify({'error': True, 'message': 'Failed to create upload'}), 500
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+
+@uploads_bp.route('/<upload_id>', methods=['PUT'])
+@token_required
+def put_chunk(upload_id):
+    """
+    Write one chunk. Offset comes from ?offset=N or Content-Range.
+    Bytes that arrive before a dropped connection are kept and reported.
+    """
+    offset = _chunk_offset()
+    if offset is None or offset < 0:
+        return jsonify({'error': 'Chunk offset required (?offset=N or Content-Range)'}), 400
+
+    length = request.content_length
+    if length is None:
+        return jsonify({'error': 'Content-Length required'}), 411
+    if length > UPLOAD_MAX_CHUNK_BYTES:
+        return jsonify({'error': f'Chunk too large (max {UPLOAD_MAX_CHUNK_BYTES} bytes)'}), 413
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        row, error = _load_session(cursor, upload_id)
+        if error:
+            return error
+        if row[11] != 'open':
+            return jsonify({'error': 'Upload is being finalized'}), 409
+        if offset + length > row[8]:
+            return jsonify({'error': 'Chunk exceeds declared total_size'}), 416
+
+        # Stream the body to disk in UPLOAD_BUFFER_SIZE pieces
+        written = 0
+        try:
+            with open(blob_store.staging_path(upload_id), 'r+b') as f:
+                f.seek(offset)
+                while written < length:
+                    chunk = request.stream.read(min(UPLOAD_BUFFER_SIZE, length - written))
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    written += len(chunk)
+        except ClientDisconnected:
+            print(f"Chunk upload for {upload_id} interrupted after {written} bytes")
+        except FileNotFoundError:
+            return jsonify({'error': 'Upload session not found or expired'}), 404
+
+        if not written:
+            return jsonify(_session_status(row))
+
+        # Record the received range; retry if another chunk updated the session first
+        for _ in range(RANGE_UPDATE_RETRIES):
+            ranges = _merge_range(json.loads(row[9]), offset, offset + written)
+            bytes_received = sum(r_end - r_start for r_start, r_end in ranges)
+            expires_at = _expiry()
+            cursor.execute(
+                """UPDATE upload_sessions
+                   SET received_ranges = ?, bytes_received = ?, expires_at = ?, version = version + 1
+                   WHERE id = ? AND version = ?""",
+                (json.dumps(ranges), bytes_received, expires_at, upload_id, row[12])
+            )
+            if cursor.rowcount == 1:
+                conn.commit()
+                return jsonify(_session_status(row, ranges, bytes_received, expires_at))
+            conn.rollback()
+            cursor.execute(f"SELECT {SESSION_COLUMNS} FROM upload_sessions WHERE id = ?", (upload_id,))
+            row = cursor.fetchone()
+            if not row:
+                return jsonify({'error': 'Upload session not found or expired'}), 404
+
+        return jsonify({'error': True, 'message': 'Concurrent chunk update, please retry'}), 409
+
+    except Exception as e:
+        conn.rollback()
+        print(f"Chunk upload error: {e}")
+        return jsonify({'error': True, 'message': 'Chunk upload failed'}), 500
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+
+@uploads_bp.route('/<upload_id>', methods=['GET'])
+@token_required
+def get_upload(upload_id):
+    """Report received and missing byte ranges so a client can resume"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        row, error = _load_session(cursor, upload_id)
+        if error:
+            return error
+        return jsonify(_session_status(row))
+
+    except Exception as e:
+        print(f"Get upload error: {e}")
+        return jsonify({'error': True, 'message': 'Failed to fetch upload'}), 500
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+
+@uploads_bp.route('/<upload_id>/complete', methods=['POST'])
+@token_required
+def complete_upload(upload_id):
+    """Move the assembled file into the blob store and create the files row"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    claimed = False
+    blob_ref = None
+
+    try:
+        row, error = _load_session(cursor, upload_id)
+        if error:
+            return error
+
+        status = _session_status(row)
+        if not status['complete']:
+            return jsonify({
+                'error': 'Upload incomplete',
+                'missing_ranges': status['missing_ranges']
+            }), 409
+
+        # Claim the session so a duplicate /complete cannot create a second file
+        cursor.execute(
+            "UPDATE upload_sessions SET status = 'finalizing' WHERE id = ? AND status = 'open'",
+            (upload_id,)
+        )
+        if cursor.rowcount != 1:
+            conn.rollback()
+            return jsonify({'error': 'Upload is already being finalized'}), 409
+        conn.commit()
+        claimed = True
+
+        blob_ref, file_size = blob_store.commit_staged(blob_store.staging_path(upload_id), UPLOAD_BUFFER_SIZE)
+
+        file_name = row[3]
+        real_owner_id = resolve_owner_id(cursor, row[2])
+        file_id, created_at = insert_uploaded_file(
+            cursor, row[1], real_owner_id, file_name, blob_ref, file_size,
+            row[4], row[5], row[6], row[7]
+        )
+        cursor.execute("DELETE FROM upload_sessions WHERE id = ?", (upload_id,))
+        conn.commit()
+
+        print(f"File uploaded (resumable): {file_id} ({file_size} bytes)")
+
+        publish_new_file(real_owner_id, file_id, file_name, file_size, created_at)
+
+        return jsonify(upload_response(file_id, file_name, file_size, created_at)), 201
+
+    except Exception as e:
+        conn.rollback()
+        if blob_ref:
+            # The staged file has been consumed, so the session cannot be retried
+            release_blobs(cursor, [blob_ref])
+            _discard_session(cursor, upload_id)
+            conn.commit()
+        elif claimed:
+            cursor.execute("UPDATE upload_sessions SET status = 'open' WHERE id = ?", (upload_id,))
+            conn.commit()
+        print(f"Complete upload error: {e}")
+        return jsonify({'error': True, 'message': 'Upload failed'}), 500
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+
+@uploads_bp.route('/<upload_id>', methods=['DELETE'])
+@token_required
+def abort_upload(upload_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        row, error = _load_session(cursor, upload_id)
+        if error:
+            return error
+        _discard_session(cursor, upload_id)
+        conn.commit()
+        return jsonify({'success': True, 'upload_id': upload_id, 'message': 'Upload aborted'})
+
+    except Exception as e:
+        conn.rollback()
+        print(f"Abort upload error: {e}")
+        return jsonify({'error': True, 'message': 'Failed to abort upload'}), 500
+    finally:
+        cursor.close()
+        release_db_connection(conn)
@@ -0,0 +1,150 @@
+-- PostgreSQL Schema for Secure File Printing System (DB_BACKEND=postgres)
+-- Mirrors schema_sqlite.sql so the route modules run unchanged on either backend:
+--   * ids are TEXT (UUID strings generated by the app)
+--   * flags are INTEGER 0/1 because queries compare them with = 0 / = 1
+--   * no FOREIGN KEY constraints: SQLite does not enforce them (foreign_keys is off)
+--     and owner sessions are stored in sessions.user_id
+
+-- Users table
+CREATE TABLE IF NOT EXISTS users (
+  id TEXT PRIMARY KEY,
+  phone TEXT UNIQUE NOT NULL,
+  password_hash TEXT NOT NULL,
+  full_name TEXT,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Sessions table
+CREATE TABLE IF NOT EXISTS sessions (
+  id TEXT PRIMARY KEY,
+  user_id TEXT NOT NULL,
+  token_hash TEXT NOT NULL,
+  refresh_token_hash TEXT NOT NULL,
+  expires_at TIMESTAMP NOT NULL,
+  refresh_expires_at TIMESTAMP NOT NULL,
+  is_valid INTEGER DEFAULT 1,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Owners table
+CREATE TABLE IF NOT EXISTS owners (
+  id TEXT PRIMARY KEY,
+  email TEXT UNIQUE NOT NULL,
+  password_hash TEXT NOT NULL,
+  full_name TEXT,
+  public_key TEXT NOT NULL,
+  private_key_encrypted TEXT NOT NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Files table
+CREATE TABLE IF NOT EXISTS files (
+  id TEXT PRIMARY KEY,
+  user_id TEXT NOT NULL,
+  owner_id TEXT NOT NULL,
+  file_name TEXT NOT NULL,
+  encrypted_file_data BYTEA NOT NULL, -- Legacy inline ciphertext; empty when blob_ref is set
+  blob_ref TEXT, -- SHA-256 of the ciphertext in the blob store
+  file_size_bytes BIGINT NOT NULL,
+  file_mime_type TEXT,
+  iv_vector BYTEA NOT NULL,
+  auth_tag BYTEA NOT NULL,
+  encrypted_symmetric_key BYTEA NOT NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  deleted_at TIMESTAMP,
+  is_deleted INTEGER DEFAULT 0,
+  is_printed INTEGER DEFAULT 0,
+  printed_at TIMESTAMP,
+  status TEXT DEFAULT 'UPLOADED' NOT NULL CHECK(status IN ('UPLOADED', 'WAITING_FOR_APPROVAL', 'APPROVED', 'BEING_PRINTED', 'PRINT_COMPLETED', 'REJECTED', 'CANCELLED')),
+  status_updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  rejection_reason TEXT
+);
+
+-- Resumable upload sessions (chunks accumulate in the blob store staging area)
+CREATE TABLE IF NOT EXISTS upload_sessions (
+  id TEXT PRIMARY KEY,
+  user_id TEXT NOT NULL,
+  owner_id TEXT NOT NULL,
+  file_name TEXT NOT NULL,
+  file_mime_type TEXT,
+  iv_vector BYTEA NOT NULL,
+  auth_tag BYTEA NOT NULL,
+  encrypted_symmetric_key BYTEA NOT NULL,
+  total_size BIGINT NOT NULL,
+  received_ranges TEXT NOT NULL DEFAULT '[]', -- JSON list of [start, end) byte ranges
+  bytes_received BIGINT NOT NULL DEFAULT 0,
+  status TEXT NOT NULL DEFAULT 'open' CHECK(status IN ('open', 'finalizing')),
+  version INTEGER NOT NULL DEFAULT 0, -- Optimistic lock for concurrent chunk writes
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  expires_at TIMESTAMP NOT NULL
+);
+
+-- Append-only change log for delta sync (/api/files/changes)
+CREATE TABLE IF NOT EXISTS file_changes (
+  seq BIGSERIAL PRIMARY KEY,
+  file_id TEXT NOT NULL,
+  owner_id TEXT NOT NULL,
+  user_id TEXT,
+  change_type TEXT NOT NULL CHECK(change_type IN ('insert', 'status', 'delete')),
+  status TEXT,
+  changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Highest file_changes.seq pruned by the session sweeper; clients polling
+-- /api/files/changes from before it must re-list
+CREATE TABLE IF NOT EXISTS file_changes_pruned (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  seq BIGINT NOT NULL
+);
+
+-- Per-owner / per-user change counter behind listing ETags
+CREATE TABLE IF NOT EXISTS sync_versions (
+  principal_id TEXT PRIMARY KEY, -- owners.id or users.id
+  version BIGINT NOT NULL DEFAULT 0
+);
+
+-- Revoked access tokens; every worker tails this into its in-memory deny list
+CREATE TABLE IF NOT EXISTS revoked_tokens (
+  seq BIGSERIAL PRIMARY KEY,
+  token_hash TEXT NOT NULL,
+  expires_at BIGINT NOT NULL, -- Unix time after which the token is dead anyway
+  revoked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Pending desktop Google sign-ins, shared by all workers (see oauth_store.py)
+CREATE TABLE IF NOT EXISTS oauth_sessions (
+  id TEXT PRIMARY KEY, -- session_id chosen by the desktop app
+  status TEXT NOT NULL DEFAULT 'pending',
+  result TEXT, -- JSON handed to the desktop app once signed in
+  expires_at BIGINT NOT NULL -- Unix time
+);
+
+-- Create indexes for performance
+CREATE INDEX IF NOT EXISTS idx_users_phone ON users(phone);
+CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id);
+CREATE INDEX IF NOT EXISTS idx_sessions_token_hash ON sessions(token_hash);
+CREATE INDEX IF NOT EXISTS idx_sessions_refresh_token_hash ON sessions(refresh_token_hash);
+-- Session sweeper: expired rows by expires_at, invalidated rows via a partial index
+CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions(expires_at);
+CREATE INDEX IF NOT EXISTS idx_sessions_invalid ON sessions(id) WHERE is_valid = 0;
+CREATE INDEX IF NOT EXISTS idx_owners_email ON owners(email);
+CREATE INDEX IF NOT EXISTS idx_files_user_id ON files(user_id);
+CREATE INDEX IF NOT EXISTS idx_files_owner_id ON files(owner_id);
+CREATE INDEX IF NOT EXISTS idx_files_created_at ON files(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_files_is_deleted ON files(is_deleted);
+CREATE INDEX IF NOT EXISTS idx_files_status ON files(status);
+CREATE INDEX IF NOT EXISTS idx_files_blob_ref ON files(blob_ref);
+-- Keyset pagination: (created_at, id) for /api/files, (deleted_at, id) for /api/history
+CREATE INDEX IF NOT EXISTS idx_files_owner_created ON files(owner_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_files_user_created ON files(user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_files_owner_deleted ON files(owner_id, is_deleted, deleted_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_upload_sessions_user_id ON upload_sessions(user_id);
+CREATE INDEX IF NOT EXISTS idx_upload_sessions_expires_at ON upload_sessions(expires_at);
+CREATE INDEX IF NOT EXISTS idx_file_changes_owner_seq ON file_changes(owner_id, seq);
+CREATE INDEX IF NOT EXISTS idx_file_changes_user_seq ON file_changes(user_id, seq);
+CREATE INDEX IF NOT EXISTS idx_file_changes_changed_at ON file_changes(changed_at);
+CREATE INDEX IF NOT EXISTS idx_revoked_tokens_expires_at ON revoked_tokens(expires_at);
+CREATE INDEX IF NOT EXISTS idx_oauth_sessions_expires_at ON oauth_sessions(expires_at);
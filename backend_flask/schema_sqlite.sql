@@ -42,7 +42,8 @@ CREATE TABLE IF NOT EXISTS files (
   user_id TEXT NOT NULL,
   owner_id TEXT NOT NULL,
   file_name TEXT NOT NULL,
-  encrypted_file_data BLOB NOT NULL,
+  encrypted_file_data BLOB NOT NULL, -- Legacy inline ciphertext; empty when blob_ref is set
+  blob_ref TEXT, -- SHA-256 of the ciphertext in the blob store
   file_size_bytes INTEGER NOT NULL,
   file_mime_type TEXT,
   iv_vector BLOB NOT NULL,
@@ -61,13 +62,89 @@ CREATE TABLE IF NOT EXISTS files (
   FOREIGN KEY (owner_id) REFERENCES owners(id)
 );
 
+-- Resumable upload sessions (chunks accumulate in the blob store staging area)
+CREATE TABLE IF NOT EXISTS upload_sessions (
+  id TEXT PRIMARY KEY,
+  user_id TEXT NOT NULL,
+  owner_id TEXT NOT NULL,
+  file_name TEXT NOT NULL,
+  file_mime_type TEXT,
+  iv_vector BLOB NOT NULL,
+  auth_tag BLOB NOT NULL,
+  encrypted_symmetric_key BLOB NOT NULL,
+  total_size INTEGER NOT NULL,
+  received_ranges TEXT NOT NULL DEFAULT '[]', -- JSON list of [start, end) byte ranges
+  bytes_received INTEGER NOT NULL DEFAULT 0,
+  status TEXT NOT NULL DEFAULT 'open' CHECK(status IN ('open', 'finalizing')),
+  version INTEGER NOT NULL DEFAULT 0, -- Optimistic lock for concurrent chunk writes
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  expires_at TIMESTAMP NOT NULL,
+  FOREIGN KEY (user_id) REFERENCES users(id)
+);
+
+-- Append-only change log for delta sync (/api/files/changes)
+CREATE TABLE IF NOT EXISTS file_changes (
+  seq INTEGER PRIMARY KEY AUTOINCREMENT,
+  file_id TEXT NOT NULL,
+  owner_id TEXT NOT NULL,
+  user_id TEXT,
+  change_type TEXT NOT NULL CHECK(change_type IN ('insert', 'status', 'delete')),
+  status TEXT,
+  changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Highest file_changes.seq pruned by the session sweeper; clients polling
+-- /api/files/changes from before it must re-list
+CREATE TABLE IF NOT EXISTS file_changes_pruned (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  seq INTEGER NOT NULL
+);
+
+-- Per-owner / per-user change counter behind listing ETags
+CREATE TABLE IF NOT EXISTS sync_versions (
+  principal_id TEXT PRIMARY KEY, -- owners.id or users.id
+  version INTEGER NOT NULL DEFAULT 0
+);
+
+-- Revoked access tokens; every worker tails this into its in-memory deny list
+CREATE TABLE IF NOT EXISTS revoked_tokens (
+  seq INTEGER PRIMARY KEY AUTOINCREMENT,
+  token_hash TEXT NOT NULL,
+  expires_at INTEGER NOT NULL, -- Unix time after which the token is dead anyway
+  revoked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Pending desktop Google sign-ins, shared by all workers (see oauth_store.py)
+CREATE TABLE IF NOT EXISTS oauth_sessions (
+  id TEXT PRIMARY KEY, -- session_id chosen by the desktop app
+  status TEXT NOT NULL DEFAULT 'pending',
+  result TEXT, -- JSON handed to the desktop app once signed in
+  expires_at INTEGER NOT NULL -- Unix time
+);
+
 -- Create indexes for performance
 CREATE INDEX IF NOT EXISTS idx_users_phone ON users(phone);
 CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id);
 CREATE INDEX IF NOT EXISTS idx_sessions_token_hash ON sessions(token_hash);
+CREATE INDEX IF NOT EXISTS idx_sessions_refresh_token_hash ON sessions(refresh_token_hash);
+-- Session sweeper: expired rows by expires_at, invalidated rows via a partial index
+CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions(expires_at);
+CREATE INDEX IF NOT EXISTS idx_sessions_invalid ON sessions(id) WHERE is_valid = 0;
 CREATE INDEX IF NOT EXISTS idx_owners_email ON owners(email);
 CREATE INDEX IF NOT EXISTS idx_files_user_id ON files(user_id);
 CREATE INDEX IF NOT EXISTS idx_files_owner_id ON files(owner_id);
 CREATE INDEX IF NOT EXISTS idx_files_created_at ON files(created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_files_is_deleted ON files(is_deleted);
 CREATE INDEX IF NOT EXISTS idx_files_status ON files(status);
+CREATE INDEX IF NOT EXISTS idx_files_blob_ref ON files(blob_ref);
+-- Keyset pagination: (created_at, id) for /api/files, (deleted_at, id) for /api/history
+CREATE INDEX IF NOT EXISTS idx_files_owner_created ON files(owner_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_files_user_created ON files(user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_files_owner_deleted ON files(owner_id, is_deleted, deleted_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_upload_sessions_user_id ON upload_sessions(user_id);
+CREATE INDEX IF NOT EXISTS idx_upload_sessions_expires_at ON upload_sessions(expires_at);
+CREATE INDEX IF NOT EXISTS idx_file_changes_owner_seq ON file_changes(owner_id, seq);
+CREATE INDEX IF NOT EXISTS idx_file_changes_user_seq ON file_changes(user_id, seq);
+CREATE INDEX IF NOT EXISTS idx_file_changes_changed_at ON file_changes(changed_at);
+CREATE INDEX IF NOT EXISTS idx_revoked_tokens_expires_at ON revoked_tokens(expires_at);
+CREATE INDEX IF NOT EXISTS idx_oauth_sessions_expires_at ON oauth_sessions(expires_at);
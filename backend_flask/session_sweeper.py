@@ -0,0 +1,171 @@
+"""
+Background cleanup of the sessions table and other append-only tables.
+
+Every login adds a sessions row. This daemon thread deletes rows that have
+expired or were invalidated (logout, refresh, session cap), plus revoked_tokens
+entries whose token has expired anyway and file_changes rows older than
+FILE_CHANGES_RETENTION_DAYS. Deletes run in small batches on indexed columns
+so they never hold the write lock for long.
+
+A valid row is only deleted once both of its tokens have expired: while the
+access token lives, revoke_sessions needs the row to find it.
+"""
+
+import os
+import time
+import datetime
+import logging
+import threading
+from db import acquire_db_connection, release_db_connection
+from auth_utils import ACCESS_TOKEN_LIFETIME
+from file_changes import mark_pruned, FILE_CHANGES_RETENTION_DAYS
+
+logger = logging.getLogger(__name__)
+
+SESSION_SWEEP_INTERVAL = float(os.getenv('SESSION_SWEEP_INTERVAL', 300))  # Seconds between sweeps; 0 disables
+SESSION_SWEEP_BATCH = int(os.getenv('SESSION_SWEEP_BATCH', 500))  # Rows per DELETE
+SESSION_SWEEP_PAUSE = 0.01  # Seconds between batches, so request writes get the lock
+
+
+class SessionSweeper:
+    def __init__(self, interval=SESSION_SWEEP_INTERVAL, batch_size=SESSION_SWEEP_BATCH):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._runs = 0
+        self._errors = 0
+        self._deleted_expired = 0
+        self._deleted_invalid = 0
+        self._deleted_revocations = 0
+        self._deleted_changes = 0
+        self._last_duration = 0.0
+        self._last_run = None
+        self._sessions = None
+        self._active_sessions = None
+
+    def start(self):
+        # Again after fork: the parent's thread does not exist in the child
+        if self.interval <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='session-sweeper', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                with self._lock:
+                    self._errors += 1
+                logger.error(f"Session sweep failed: {e}")
+
+    def _delete_batches(self, conn, table, key, where_sql, params):
+        """Delete matching rows batch_size at a time; one short transaction per batch"""
+        total = 0
+        while not self._stop.is_set():
+            cursor = conn.cursor()
+            try:
+                cursor.execute(
+                    f"DELETE FROM {table} WHERE {key} IN (SELECT {key} FROM {table} WHERE {where_sql} LIMIT ?)",
+                    params + (self.batch_size,)
+                )
+                deleted = cursor.rowcount
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+            total += max(deleted, 0)
+            if deleted < self.batch_size:
+                break
+            time.sleep(SESSION_SWEEP_PAUSE)
+        return total
+
+    def _prune_changes(self, conn, now):
+        if FILE_CHANGES_RETENTION_DAYS <= 0:
+            return 0
+        cursor = conn.cursor()
+        try:
+            cutoff = mark_pruned(cursor, now - datetime.timedelta(days=FILE_CHANGES_RETENTION_DAYS))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        if not cutoff:
+            return 0
+        return self._delete_batches(conn, 'file_changes', 'seq', "seq <= ?", (cutoff,))
+
+    def sweep(self):
+        """Run one sweep now. Returns the number of rows deleted per kind."""
+        started = time.monotonic()
+        now = datetime.datetime.utcnow()
+        conn = acquire_db_connection()
+        try:
+            # created_at: rows stored before expires_at covered the access token
+            # (it used to be the 7-day refresh expiry) are kept until that expires
+            expired = self._delete_batches(conn, 'sessions', 'id', "expires_at < ? AND created_at < ?",
+                                           (now, now - ACCESS_TOKEN_LIFETIME))
+            invalid = self._delete_batches(conn, 'sessions', 'id', "is_valid = 0", ())
+            revocations = self._delete_batches(conn, 'revoked_tokens', 'seq', "expires_at < ?", (int(time.time()),))
+            changes = self._prune_changes(conn, now)
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT COUNT(*), COALESCE(SUM(CASE WHEN is_valid = 1 THEN 1 ELSE 0 END), 0) FROM sessions")
+                sessions, active = cursor.fetchone()
+                conn.commit()
+            finally:
+                cursor.close()
+        finally:
+            release_db_connection(conn)
+
+        duration = time.monotonic() - started
+        with self._lock:
+            self._runs += 1
+            self._deleted_expired += expired
+            self._deleted_invalid += invalid
+            self._deleted_revocations += revocations
+            self._deleted_changes += changes
+            self._last_duration = duration
+            self._last_run = now.isoformat()
+            self._sessions = sessions
+            self._active_sessions = active
+        if expired or invalid or revocations or changes:
+            logger.info(f"Session sweep removed {expired} expired, {invalid} invalidated sessions, "
+                        f"{revocations} revocations and {changes} file changes in {duration * 1000:.0f}ms")
+        return {'expired': expired, 'invalid': invalid, 'revocations': revocations, 'changes': changes}
+
+    def stats(self):
+        with self._lock:
+            return {
+                'interval': self.interval,
+                'batch_size': self.batch_size,
+                'runs': self._runs,
+                'errors': self._errors,
+                'last_run': self._last_run,
+                'last_duration_ms': round(self._last_duration * 1000, 2),
+                'deleted_expired': self._deleted_expired,
+                'deleted_invalid': self._deleted_invalid,
+                'deleted_revocations': self._deleted_revocations,
+                'deleted_changes': self._deleted_changes,
+                # Table size as of the last sweep (counted there, not per metrics call)
+                'sessions': self._sessions,
+                'active_sessions': self._active_sessions
+            }
+
+
+# Global instance
+session_sweeper = SessionSweeper()
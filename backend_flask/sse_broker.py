@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Cross-worker SSE delivery. SSEManager.publish hands events to a broker, and
+# every worker's broker delivers them to that worker's local listeners.
+#   memory - single process only (development server, gunicorn -w 1)
+#   sqlite - shared event log file; each worker tails it. Works for any number
+#            of worker processes on one host, with no external service.
+SSE_BROKER = os.getenv('SSE_BROKER', 'memory')
+SSE_BROKER_DB = os.getenv('SSE_BROKER_DB', 'sse_events.sqlite')
+SSE_BROKER_PATH = os.path.join(os.path.dirname(__file__), SSE_BROKER_DB)
+SSE_BROKER_POLL_INTERVAL = float(os.getenv('SSE_BROKER_POLL_INTERVAL', 0.1))  # Seconds between log reads
+SSE_BROKER_RETENTION = float(os.getenv('SSE_BROKER_RETENTION', 300))  # Seconds events stay in the log
+SSE_BROKER_BATCH_SIZE = 500
+
+
+class Broker:
+    """
+    Transport between publishers and the listeners held by each worker.
+    start(deliver) is called once per process; deliver(owner_id, event_id,
+    event_type, data) fans an event out to the local listeners.
+
+    The broker assigns event ids: increasing, and the same on every worker, so a
+    client can resume with Last-Event-ID on any of them. history_floor is the
+    newest id this process may have missed (published before it started
+    receiving events).
+    """
+
+    def __init__(self):
+        self._deliver = None
+        self.history_floor = 0
+
+    def start(self, deliver):
+        self._deliver = deliver
+
+    def publish(self, owner_id, event_type, data):
+        """Send an event to every worker. Returns the number of local listeners reached."""
+        raise NotImplementedError
+
+    def stop(self):
+        pass
+
+    def stats(self):
+        return {'backend': self.name}
+
+
+class MemoryBroker(Broker):
+    """In-process delivery only"""
+    name = 'memory'
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        # Seeded from the clock so ids keep increasing across restarts
+        self._last_id = int(time.time() * 1000)
+
+    def start(self, deliver):
+        with self._lock:
+            if self._deliver is None:
+                self.history_floor = self._last_id
+            super().start(deliver)
+
+    def publish(self, owner_id, event_type, data):
+        with self._lock:
+            self._last_id += 1
+            event_id = self._last_id
+        return self._deliver(owner_id, event_id, event_type, data) if self._deliver else 0
+
+
+class SQLiteEventLogBroker(Broker):
+    """
+    Events are appended to a small SQLite log shared by all workers. A daemon
+    thread in each worker tails the log and delivers rows written by other
+    workers; the publishing worker delivers its own events immediately.
+    """
+    name = 'sqlite'
+
+    def __init__(self, path, poll_interval=SSE_BROKER_POLL_INTERVAL, retention=SSE_BROKER_RETENTION):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.origin = uuid.uuid4().hex  # Identifies this process's rows
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._last_id = 0
+        self._published = 0
+        self._received = 0
+        self._errors = 0
+        self._init_log()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _conn(self):
+        # One writer connection per publishing thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _init_log(self):
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sse_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    origin TEXT NOT NULL,
+                    owner_id TEXT NOT NULL,
+                    event_type TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sse_events_created_at ON sse_events(created_at)")
+        finally:
+            conn.close()
+
+    def start(self, deliver):
+        with self._lock:
+            super().start(deliver)
+            if self._thread is not None:
+                return
+            conn = self._connect()
+            try:
+                # Only events published from now on; history is the ring buffer's job
+                self._last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM sse_events").fetchone()[0]
+                self.history_floor = self._last_id
+            finally:
+                conn.close()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._tail, name='sse-broker-tail', daemon=True)
+            self._thread.start()
+
+    def publish(self, owner_id, event_type, data):
+        # The log's rowid doubles as the event id shared by all workers
+        event_id = self._conn().execute(
+            "INSERT INTO sse_events (origin, owner_id, event_type, data, created_at) VALUES (?, ?, ?, ?, ?)",
+            (self.origin, owner_id, event_type, json.dumps(data), time.time())
+        ).lastrowid
+        with self._lock:
+            self._published += 1
+        return self._deliver(owner_id, event_id, event_type, data) if self._deliver else 0
+
+    def _tail(self):
+        conn = self._connect()
+        last_prune = 0
+        try:
+            while not self._stop.wait(self.poll_interval):
+                try:
+                    rows = conn.execute(
+                        """SELECT id, origin, owner_id, event_type, data FROM sse_events
+                           WHERE id > ? ORDER BY id LIMIT ?""",
+                        (self._last_id, SSE_BROKER_BATCH_SIZE)
+                    ).fetchall()
+                    for event_id, origin, owner_id, event_type, data in rows:
+                        self._last_id = event_id
+                        if origin == self.origin:
+                            continue
+                        with self._lock:
+                            self._received += 1
+                        self._deliver(owner_id, event_id, event_type, json.loads(data))
+
+                    now = time.time()
+                    if now - last_prune > self.retention:
+                        last_prune = now
+                        conn.execute("DELETE FROM sse_events WHERE created_at < ?", (now - self.retention,))
+                except Exception as e:
+                    with self._lock:
+                        self._errors += 1
+                    logger.error(f"SSE broker tail error: {e}")
+        finally:
+            conn.close()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': self.name,
+                'published': self._published,
+                'received': self._received,
+                'errors': self._errors,
+                'last_id': self._last_id
+            }
+
+
+# Available backends, selected with SSE_BROKER
+SSE_BROKER_BACKENDS = {
+    'memory': lambda: MemoryBroker(),
+    'sqlite': lambda: SQLiteEventLogBroker(SSE_BROKER_PATH),
+}
+
+
+def create_broker(name=SSE_BROKER):
+    if name not in SSE_BROKER_BACKENDS:
+        raise ValueError(f"Unknown SSE_BROKER '{name}'. Options: {', '.join(SSE_BROKER_BACKENDS)}")
+    return SSE_BROKER_BACKENDS[name]()
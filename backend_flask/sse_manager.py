@@ -1,55 +1,331 @@
+import os
 import queue
 import json
 import logging
+import threading
+import time
+import collections
+from sse_broker import create_broker
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Per-listener buffering. A client that stops reading fills its queue; what
+# happens next is set by SSE_OVERFLOW_POLICY:
+#   drop_oldest - discard the oldest queued event to make room
+#   coalesce    - replace a queued event for the same file (or of the same type),
+#                 falling back to drop_oldest
+#   disconnect  - close the stream; the client reconnects and re-syncs
+SSE_QUEUE_SIZE = int(os.getenv('SSE_QUEUE_SIZE', 100))
+SSE_OVERFLOW_POLICY = os.getenv('SSE_OVERFLOW_POLICY', 'drop_oldest')
+OVERFLOW_POLICIES = ('drop_oldest', 'coalesce', 'disconnect')
+
+# Recent events kept per owner so a reconnecting client (Last-Event-ID) can
+# catch up. Older gaps get a single 'resync_required' event instead.
+SSE_REPLAY_BUFFER_SIZE = int(os.getenv('SSE_REPLAY_BUFFER_SIZE', 200))
+SSE_REPLAY_MAX_AGE = float(os.getenv('SSE_REPLAY_MAX_AGE', 600))  # Seconds
+
+
+class ListenerClosed(Exception):
+    """Raised by Listener.get() once the listener has been disconnected"""
+    pass
+
+
+class Listener:
+    """
+    Bounded event queue for one SSE connection.
+    get() raises queue.Empty on timeout, like queue.Queue.
+    """
+
+    def __init__(self, owner_id, max_size=SSE_QUEUE_SIZE, policy=SSE_OVERFLOW_POLICY):
+        self.owner_id = owner_id
+        self.max_size = max_size
+        self.policy = policy
+        self._items = collections.deque()  # (coalesce_key, message)
+        self._cond = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+        self.coalesced = 0
+
+    def put(self, message, coalesce_key=None):
+        """Enqueue a formatted message. Returns False if the listener is (now) closed."""
+        with self._cond:
+            if self.closed:
+                return False
+            if len(self._items) >= self.max_size:
+                if self.policy == 'disconnect':
+                    self.closed = True
+                    self._items.clear()
+                    self._cond.notify_all()
+                    return False
+                if self.policy == 'coalesce' and self._replace(coalesce_key, message):
+                    self.coalesced += 1
+                    self._cond.notify()
+                    return True
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append((coalesce_key, message))
+            self._cond.notify()
+            return True
+
+    def _replace(self, coalesce_key, message):
+        # Newest matching entry, so the replacement keeps the latest position
+        if coalesce_key is None:
+            return False
+        for i in range(len(self._items) - 1, -1, -1):
+            if self._items[i][0] == coalesce_key:
+                del self._items[i]
+                self._items.append((coalesce_key, message))
+                return True
+        return False
+
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._items and not self.closed:
+                self._cond.wait(timeout)
+            if self._items:
+                return self._items.popleft()[1]
+            if self.closed:
+                raise ListenerClosed()
+            raise queue.Empty()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def qsize(self):
+        with self._cond:
+            return len(self._items)
+
+
+def user_channel(user_id):
+    """Channel for an uploading (mobile) user; kept apart from owner ids"""
+    return f"user:{user_id}"
+
+
+def stream_channel(claims):
+    """Channel a stream listens on for a verified token: owners by id, users via user_channel()"""
+    if claims.get('role') == 'user':
+        return user_channel(claims['sub'])
+    return claims['sub']
+
+
+def format_event(event_id, event_type, data):
+    """Server-Sent Event wire format"""
+    return f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+
+class ReplayBuffer:
+    """
+    Per-owner ring buffers of (event_id, timestamp, event_type, coalesce_key, message),
+    bounded by count and age. Not thread-safe; SSEManager guards it with its lock.
+    """
+
+    def __init__(self, max_size=SSE_REPLAY_BUFFER_SIZE, max_age=SSE_REPLAY_MAX_AGE):
+        self.max_size = max_size
+        self.max_age = max_age
+        self._events = {}  # owner_id -> deque
+        self._evicted_upto = {}  # owner_id -> newest event id no longer buffered
+        self._swept_upto = 0  # Newest id dropped together with an idle owner's buffer
+        self._last_sweep = time.time()
+
+    def append(self, owner_id, event_id, event_type, coalesce_key, message):
+        now = time.time()
+        events = self._events.get(owner_id)
+        if events is None:
+            events = self._events[owner_id] = collections.deque()
+        events.append((event_id, now, event_type, coalesce_key, message))
+        while len(events) > self.max_size:
+            self._evict(owner_id, events)
+        if now - self._last_sweep > self.max_age:
+            self._sweep(now)
+
+    def _evict(self, owner_id, events):
+        # Events arrive in id order only per worker: a remote event tailed from
+        # the broker can be older than a local one already buffered, so the
+        # marker must never move backwards
+        event_id = events.popleft()[0]
+        self._evicted_upto[owner_id] = max(self._evicted_upto.get(owner_id, 0), event_id)
+
+    def _expire(self, owner_id, now):
+        events = self._events.get(owner_id)
+        while events and now - events[0][1] > self.max_age:
+            self._evict(owner_id, events)
+
+    def _sweep(self, now):
+        # Drop owners with nothing recent so idle owners do not pin memory
+        self._last_sweep = now
+        for owner_id in list(self._events):
+            self._expire(owner_id, now)
+            if not self._events[owner_id]:
+                del self._events[owner_id]
+                self._swept_upto = max(self._swept_upto, self._evicted_upto.pop(owner_id, 0))
+
+    def since(self, owner_id, last_event_id, floor):
+        """
+        Buffered events after last_event_id, oldest first, or None when some of
+        them are gone (evicted, expired, or published before this process's
+        history begins at `floor`).
+        """
+        self._expire(owner_id, time.time())
+        events = self._events.get(owner_id)
+        lost_upto = max(floor, self._evicted_upto.get(owner_id, 0))
+        if not events:
+            lost_upto = max(lost_upto, self._swept_upto)
+        if last_event_id < lost_upto:
+            return None
+        return [e for e in (events or ()) if e[0] > last_event_id]
+
+    def stats(self):
+        return {
+            'owners': len(self._events),
+            'events': sum(len(e) for e in self._events.values()),
+            'max_size': self.max_size,
+            'max_age': self.max_age
+        }
+
+
 class SSEManager:
-    def __init__(self):
-        # Dictionary to store listeners: owner_id -> list of queues
+    def __init__(self, max_queue_size=SSE_QUEUE_SIZE, overflow_policy=SSE_OVERFLOW_POLICY, broker=None,
+                 replay_buffer_size=SSE_REPLAY_BUFFER_SIZE, replay_max_age=SSE_REPLAY_MAX_AGE):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown SSE_OVERFLOW_POLICY '{overflow_policy}'. Options: {', '.join(OVERFLOW_POLICIES)}")
+        self.max_queue_size = max_queue_size
+        self.overflow_policy = overflow_policy
+        # owner_id -> tuple of Listeners. Tuples are replaced, never mutated,
+        # so publish can iterate a snapshot without holding the lock.
         self.listeners = {}
+        self._lock = threading.Lock()
+        self._published = 0
+        self._disconnected = 0
+        # Drop/coalesce counts carried over from listeners that have gone away
+        self._dropped = 0
+        self._coalesced = 0
+        # Carries published events to every worker (see sse_broker.py)
+        self.broker = broker if broker is not None else create_broker()
+        self.replay = ReplayBuffer(replay_buffer_size, replay_max_age)
+        self._last_event_id = 0
+        self._replayed = 0
+        self._resyncs = 0
 
-    def listen(self, owner_id):
-        """Register a new listener for an owner"""
-        q = queue.Queue()
-        if owner_id not in self.listeners:
-            self.listeners[owner_id] = []
-        self.listeners[owner_id].append(q)
-        logger.info(f"New listener registered for owner {owner_id}. Total listeners: {len(self.listeners[owner_id])}")
-        return q
+    def listen(self, owner_id, last_event_id=None, listener_class=Listener):
+        """
+        Register a new listener for an owner.
+        With last_event_id (the client's Last-Event-ID), events it missed are
+        queued first, or a single 'resync_required' event if they are no longer
+        buffered or would not fit in the listener's queue. listener_class lets other servers (sse_server.py) plug in a
+        Listener subclass with their own wake-up mechanism.
+        """
+        # Started lazily so only workers that hold streams tail the broker
+        self.broker.start(self._deliver)
+        listener = listener_class(owner_id, self.max_queue_size, self.overflow_policy)
+        with self._lock:
+            # Replay and registration happen under the lock that _deliver uses to
+            # buffer events, so every event is either replayed or delivered, once
+            if last_event_id is not None:
+                missed = self.replay.since(owner_id, last_event_id, self.broker.history_floor)
+                # More than the queue holds would be dropped (or close it) on replay
+                if missed is None or len(missed) > self.max_queue_size:
+                    self._resyncs += 1
+                    listener.put(format_event(
+                        max(self._last_event_id, self.broker.history_floor, last_event_id),
+                        'resync_required',
+                        {'message': 'Missed events are no longer available; re-fetch the file list',
+                         'last_event_id': last_event_id}
+                    ))
+                else:
+                    self._replayed += len(missed)
+                    for _, _, _, coalesce_key, message in missed:
+                        listener.put(message, coalesce_key)
+            self.listeners[owner_id] = self.listeners.get(owner_id, ()) + (listener,)
+            total = len(self.listeners[owner_id])
+        logger.info(f"New listener registered for owner {owner_id}. Total listeners: {total}")
+        return listener
 
     def publish(self, owner_id, event_type, data):
-        """Publish an event to all listeners of an owner"""
-        if owner_id in self.listeners:
-            # Format as Server-Sent Event
-            msg = f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
-            
-            dead_queues = []
-            count = 0
-            for q in self.listeners[owner_id]:
-                try:
-                    q.put(msg)
-                    count += 1
-                except Exception as e:
-                    logger.error(f"Error publishing to queue: {e}")
-                    dead_queues.append(q)
-            
-            # Cleanup dead queues
-            for q in dead_queues:
-                if q in self.listeners[owner_id]:
-                    self.listeners[owner_id].remove(q)
-            
-            logger.info(f"Published '{event_type}' to {count} listeners for owner {owner_id}")
+        """
+        Publish an event to all listeners of an owner, on every worker.
+        Returns the number of listeners reached in this process.
+        """
+        return self.broker.publish(owner_id, event_type, data)
+
+    def _deliver(self, owner_id, event_id, event_type, data):
+        """Buffer an event and fan it out to this process's listeners (called by the broker)"""
+        # Format as Server-Sent Event
+        msg = format_event(event_id, event_type, data)
+        if event_type.endswith('_batch'):
+            # Dispatcher batches (event_dispatcher.py) carry several files and
+            # no file_id; replacing one would lose its files
+            coalesce_key = None
+        elif isinstance(data, dict):
+            coalesce_key = (event_type, data.get('file_id'))
         else:
+            coalesce_key = (event_type, None)
+
+        with self._lock:
+            self._last_event_id = max(self._last_event_id, event_id)
+            self.replay.append(owner_id, event_id, event_type, coalesce_key, msg)
+            targets = self.listeners.get(owner_id, ())
+        if not targets:
             logger.info(f"No listeners found for owner {owner_id}")
+            return 0
+
+        count = 0
+        for listener in targets:
+            if listener.put(msg, coalesce_key):
+                count += 1
+            else:
+                # Overflowed under the 'disconnect' policy (or already closed)
+                self.remove_listener(owner_id, listener)
+                with self._lock:
+                    self._disconnected += 1
+        with self._lock:
+            self._published += 1
+
+        logger.info(f"Published '{event_type}' to {count} listeners for owner {owner_id}")
+        return count
 
     def remove_listener(self, owner_id, q):
-        """Remove a specific listener queue"""
-        if owner_id in self.listeners and q in self.listeners[owner_id]:
-            self.listeners[owner_id].remove(q)
-            logger.info(f"Listener removed for owner {owner_id}")
+        """Remove a specific listener queue; owners without listeners are dropped"""
+        q.close()
+        with self._lock:
+            current = self.listeners.get(owner_id, ())
+            if q not in current:
+                return
+            remaining = tuple(l for l in current if l is not q)
+            self._dropped += q.dropped
+            self._coalesced += q.coalesced
+            if remaining:
+                self.listeners[owner_id] = remaining
+            else:
+                del self.listeners[owner_id]
+        logger.info(f"Listener removed for owner {owner_id}")
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self.listeners)
+            published = self._published
+            disconnected = self._disconnected
+            dropped = self._dropped
+            coalesced = self._coalesced
+            replay = self.replay.stats()
+            replay.update(replayed=self._replayed, resyncs=self._resyncs, last_event_id=self._last_event_id)
+        all_listeners = [l for group in snapshot.values() for l in group]
+        return {
+            'owners': len(snapshot),
+            'listeners': len(all_listeners),
+            'queued': sum(l.qsize() for l in all_listeners),
+            'published': published,
+            'dropped': dropped + sum(l.dropped for l in all_listeners),
+            'coalesced': coalesced + sum(l.coalesced for l in all_listeners),
+            'disconnected': disconnected,
+            'max_queue_size': self.max_queue_size,
+            'overflow_policy': self.overflow_policy,
+            'broker': self.broker.stats(),
+            'replay': replay
+        }
 
 # Global instance
 sse_manager = SSEManager()
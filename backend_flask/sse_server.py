@@ -0,0 +1,236 @@
+"""
+Asyncio server for /api/events/stream.
+
+The Flask route holds one worker thread per connected client for as long as
+the stream is open. This server holds every stream on a single event loop
+instead, so thousands of idle desktop connections cost a few KB each and no
+threads. REST traffic stays on the Flask app unchanged.
+
+Usage:
+    SSE_BROKER=sqlite python sse_server.py          # listens on SSE_PORT (5001)
+    SSE_BROKER=sqlite gunicorn -w 4 app:app         # REST, publishes events
+
+Route /api/events/ to SSE_PORT at the reverse proxy. Both processes must
+share the sqlite broker so uploads handled by gunicorn reach these streams.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import queue
+import resource
+from urllib.parse import urlsplit, parse_qs
+
+import jwt
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from auth_utils import verify_token, TokenRevokedError  # noqa: E402
+from sse_manager import sse_manager, stream_channel, Listener, ListenerClosed  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+SSE_HOST = os.getenv('SSE_HOST', '0.0.0.0')
+SSE_PORT = int(os.getenv('SSE_PORT', 5001))
+SSE_MAX_CONNECTIONS = int(os.getenv('SSE_MAX_CONNECTIONS', 10000))
+KEEPALIVE_INTERVAL = 20  # Seconds, same as routes/events.py
+HEADER_TIMEOUT = 10
+MAX_HEADER_LINES = 100
+CORS_ORIGINS = os.getenv('CORS_ORIGINS', '*').split(',')
+
+STATUS_TEXT = {200: 'OK', 204: 'No Content', 400: 'Bad Request', 401: 'Unauthorized',
+               404: 'Not Found', 405: 'Method Not Allowed', 503: 'Service Unavailable'}
+
+
+class AsyncListener(Listener):
+    """Listener that wakes a coroutine instead of a blocked thread"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+
+    def _notify(self):
+        # put() runs on broker/request threads; asyncio.Event is loop-only
+        try:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+        except RuntimeError:
+            pass  # Loop already closed
+
+    def put(self, message, coalesce_key=None):
+        accepted = super().put(message, coalesce_key)
+        self._notify()
+        return accepted
+
+    def close(self):
+        super().close()
+        self._notify()
+
+
+class EventStreamServer:
+    def __init__(self, manager=sse_manager, max_connections=SSE_MAX_CONNECTIONS):
+        self.manager = manager
+        self.max_connections = max_connections
+        self.connections = 0
+        self.peak_connections = 0
+
+    def _cors_headers(self, headers):
+        origin = headers.get('origin')
+        if '*' in CORS_ORIGINS:
+            return {'Access-Control-Allow-Origin': '*'}
+        if origin in CORS_ORIGINS:
+            return {'Access-Control-Allow-Origin': origin, 'Vary': 'Origin'}
+        return {}
+
+    async def _respond(self, writer, status, body=None, headers=None):
+        payload = json.dumps(body).encode() if body is not None else b''
+        lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+                 'Content-Type: application/json',
+                 f'Content-Length: {len(payload)}',
+                 'Connection: close']
+        lines += [f'{k}: {v}' for k, v in (headers or {}).items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + payload)
+        await writer.drain()
+
+    async def _read_request(self, reader):
+        request_line = await asyncio.wait_for(reader.readline(), HEADER_TIMEOUT)
+        method, target, _ = request_line.decode('latin-1').split(' ', 2)
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = await asyncio.wait_for(reader.readline(), HEADER_TIMEOUT)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return method, target, headers
+
+    async def handle(self, reader, writer):
+        try:
+            try:
+                method, target, headers = await self._read_request(reader)
+            except (ValueError, asyncio.TimeoutError):
+                await self._respond(writer, 400, {'error': True, 'message': 'Bad request'})
+                return
+
+            url = urlsplit(target)
+            cors = self._cors_headers(headers)
+            if url.path == '/health':
+                await self._respond(writer, 200, self.stats(), cors)
+            elif url.path != '/api/events/stream':
+                await self._respond(writer, 404, {'error': True, 'message': 'Not found'}, cors)
+            elif method == 'OPTIONS':
+                cors.update({'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                             'Access-Control-Allow-Headers': 'Authorization, Last-Event-ID'})
+                await self._respond(writer, 204, None, cors)
+            elif method != 'GET':
+                await self._respond(writer, 405, {'error': True, 'message': 'Method not allowed'}, cors)
+            else:
+                await self._stream(writer, headers, parse_qs(url.query), cors)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.error(f"SSE server error: {e}")
+        finally:
+            writer.close()
+
+    async def _stream(self, writer, headers, query, cors):
+        # Same checks as token_required + routes/events.py
+        auth_header = headers.get('authorization', '')
+        token = auth_header.split(' ', 1)[1] if auth_header.startswith('Bearer ') else None
+        if not token:
+            await self._respond(writer, 401, {'error': True, 'message': 'Token is missing'}, cors)
+            return
+        try:
+            # Off the loop: a cold token cache or the revocation list's first
+            # load would otherwise stall every open stream
+            user = await asyncio.get_running_loop().run_in_executor(None, verify_token, token)
+        except jwt.ExpiredSignatureError:
+            await self._respond(writer, 401, {'error': True, 'message': 'Token has expired'}, cors)
+            return
+        except TokenRevokedError:
+            await self._respond(writer, 401, {'error': True, 'message': 'Token has been revoked'}, cors)
+            return
+        except jwt.InvalidTokenError:
+            await self._respond(writer, 401, {'error': True, 'message': 'Invalid token'}, cors)
+            return
+
+        last_event_id = headers.get('last-event-id') or (query.get('last_event_id') or [None])[0]
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            await self._respond(writer, 400, {'error': 'Invalid Last-Event-ID'}, cors)
+            return
+
+        if self.connections >= self.max_connections:
+            await self._respond(writer, 503, {'error': True, 'message': 'Too many event streams'}, cors)
+            return
+
+        owner_id = stream_channel(user)
+        lines = ['HTTP/1.1 200 OK', 'Content-Type: text/event-stream', 'Cache-Control: no-cache',
+                 'Connection: keep-alive', 'X-Accel-Buffering: no']
+        lines += [f'{k}: {v}' for k, v in cors.items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        writer.write(b'event: connected\ndata: {"message": "Connected to notification stream"}\n\n')
+        await writer.drain()
+
+        listener = self.manager.listen(owner_id, last_event_id, listener_class=AsyncListener)
+        self.connections += 1
+        self.peak_connections = max(self.peak_connections, self.connections)
+        try:
+            while True:
+                # Clear before draining so a put() racing with the drain re-arms the wait
+                listener.wakeup.clear()
+                try:
+                    while True:
+                        writer.write(listener.get(timeout=0).encode())
+                except queue.Empty:
+                    pass
+                await writer.drain()
+                try:
+                    await asyncio.wait_for(listener.wakeup.wait(), KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    writer.write(b': keepalive\n\n')
+                    await writer.drain()
+        except ListenerClosed:
+            # Fell too far behind (SSE_OVERFLOW_POLICY=disconnect); the client reconnects
+            pass
+        finally:
+            self.connections -= 1
+            self.manager.remove_listener(owner_id, listener)
+
+    def stats(self):
+        return {
+            'connections': self.connections,
+            'peak_connections': self.peak_connections,
+            'max_connections': self.max_connections,
+            'sse': self.manager.stats()
+        }
+
+
+def raise_fd_limit():
+    """Each stream is a socket; lift the soft open-file limit to the hard limit"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+async def serve(host=SSE_HOST, port=SSE_PORT):
+    server = EventStreamServer()
+    tcp_server = await asyncio.start_server(server.handle, host, port, backlog=1024)
+    print(f"Event stream server running on http://{host}:{port}/api/events/stream")
+    async with tcp_server:
+        await tcp_server.serve_forever()
+
+
+if __name__ == '__main__':
+    if sse_manager.broker.name == 'memory':
+        print("WARNING: SSE_BROKER=memory only delivers events published in this process. "
+              "Use SSE_BROKER=sqlite so the Flask workers' events reach this server.")
+    print(f"Open file limit: {raise_fd_limit()}")
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,115 @@
+import base64
+import datetime
+import os
+import re
+import uuid
+from event_dispatcher import event_dispatcher
+from file_changes import record_change, CHANGE_INSERT
+
+# Shared by the single-request upload (/api/upload) and the resumable
+# chunked upload (/api/uploads) so both apply identical rules.
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024  # 50MB
+
+# Caps how much of a file body is held in memory at once while it is
+# streamed to the blob store
+UPLOAD_BUFFER_SIZE = int(os.getenv('UPLOAD_BUFFER_SIZE', 64 * 1024))
+
+# Validate file extension (Security Fix #22)
+# Must match mobile app allowed list: pdf, doc, docx
+ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx'}
+
+
+class UploadValidationError(Exception):
+    """Raised when upload metadata is missing or invalid (HTTP 400)"""
+    pass
+
+
+def validate_upload_fields(file_name, iv_vector_b64, auth_tag_b64, encrypted_key_b64, owner_id):
+    """
+    Check and decode upload metadata.
+    Returns (sanitized_file_name, iv_vector, auth_tag, encrypted_key).
+    """
+    if not all([file_name, iv_vector_b64, auth_tag_b64, encrypted_key_b64, owner_id]):
+        raise UploadValidationError('Missing required fields')
+
+    # Convert Base64 to Bytes for DB storage
+    try:
+        iv_vector = base64.b64decode(iv_vector_b64)
+        auth_tag = base64.b64decode(auth_tag_b64)
+        encrypted_key = base64.b64decode(encrypted_key_b64)
+    except Exception as e:
+        raise UploadValidationError(f'Invalid encoding: {str(e)}')
+
+    # Sanitize filename (basic)
+    file_name = re.sub(r'[^a-zA-Z0-9_.-]', '_', file_name)
+
+    ext = file_name.rsplit('.', 1)[1].lower() if '.' in file_name else ''
+    if ext not in ALLOWED_EXTENSIONS:
+        raise UploadValidationError('Invalid file type. Only PDF and DOCX allowed.')
+
+    return file_name, iv_vector, auth_tag, encrypted_key
+
+
+def resolve_owner_id(cursor, owner_id):
+    """Resolve Owner ID (Mobile app sends Email, we need UUID)"""
+    real_owner_id = owner_id
+    try:
+        cursor.execute("SELECT id FROM owners WHERE email = ?", (owner_id,))
+        row = cursor.fetchone()
+        if row:
+            real_owner_id = row[0]
+            print(f"Resolved owner email '{owner_id}' to UUID '{real_owner_id}'")
+        else:
+            # Check if it's already a UUID
+            cursor.execute("SELECT id FROM owners WHERE id = ?", (owner_id,))
+            if cursor.fetchone():
+                real_owner_id = owner_id
+            else:
+                print(f"Warning: Owner '{owner_id}' not found in DB. Using as-is.")
+    except Exception as e:
+        print(f"Error resolving owner: {e}")
+    return real_owner_id
+
+
+def insert_uploaded_file(cursor, user_id, owner_id, file_name, blob_ref, file_size,
+                         file_mime, iv_vector, auth_tag, encrypted_key):
+    """Insert the files row for a stored blob. Caller commits. Returns (file_id, created_at)."""
+    file_id = str(uuid.uuid4())
+    created_at = datetime.datetime.utcnow().isoformat()
+    status_updated_at = created_at
+    cursor.execute(
+        """INSERT INTO files (
+            id, user_id, owner_id, file_name, encrypted_file_data, blob_ref,
+            file_size_bytes, file_mime_type, iv_vector, auth_tag,
+            encrypted_symmetric_key, created_at, is_deleted, status, status_updated_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, 'WAITING_FOR_APPROVAL', ?)""",
+        (
+            file_id, user_id, owner_id, file_name, b'', blob_ref,
+            file_size, file_mime, iv_vector, auth_tag, encrypted_key, created_at, status_updated_at
+        )
+    )
+    record_change(cursor, file_id, owner_id, user_id, CHANGE_INSERT, 'WAITING_FOR_APPROVAL')
+    return file_id, created_at
+
+
+def publish_new_file(owner_id, file_id, file_name, file_size, created_at):
+    """Notify desktop client via SSE (queued, delivered in the background). Call after commit."""
+    event_dispatcher.dispatch(owner_id, "new_file", {
+        "file_id": file_id,
+        "file_name": file_name,
+        "file_size_bytes": file_size,
+        "uploaded_at": created_at
+    })
+
+
+def upload_response(file_id, file_name, file_size, created_at):
+    return {
+        'success': True,
+        'file_id': file_id,
+        'file_name': file_name,
+        'file_size_bytes': file_size,
+        'uploaded_at': created_at,
+        'status': 'WAITING_FOR_APPROVAL',
+        'status_updated_at': created_at,
+        'message': 'File uploaded successfully. Waiting for owner approval.'
+    }
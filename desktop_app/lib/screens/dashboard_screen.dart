@@ -79,17 +79,28 @@ class _DashboardScreenState extends State<DashboardScreen> {
       notificationService.events.listen((event) {
         if (event['event'] == 'new_file') {
           _handleNewFile(event['data']);
+        } else if (event['event'] == 'new_file_batch') {
+          // Server-side coalescing: a burst of uploads as {"count": n, "files": [...]}
+          _handleNewFiles(event['data']);
         }
       });
     }
   }
 
   void _handleNewFile(Map<String, dynamic> data) {
+    _showNewFiles('New file received: ${data['file_name']}');
+  }
+
+  void _handleNewFiles(Map<String, dynamic> data) {
+    _showNewFiles('${data['count']} new files received');
+  }
+
+  void _showNewFiles(String message) {
     if (!mounted) return;
     
     ScaffoldMessenger.of(context).showSnackBar(
       SnackBar(
-        content: Text('New file received: ${data['file_name']}'),
+        content: Text(message),
         action: SnackBarAction(
           label: 'Refresh',
           onPressed: () => _loadFiles(showLoading: true),
@@ -236,24 +236,30 @@ class _LoginScreenState extends State<LoginScreen> {
         ),
       );
 
-      // Poll for auth completion every 1 second
-      const maxAttempts = 30; // 30 seconds max (polling every 1s)
-      debugPrint('DEBUG: Starting polling for session: $session_id');
-
-      for (var i = 0; i < maxAttempts; i++) {
-        await Future.delayed(const Duration(seconds: 1));
+      // Wait for auth completion. The server holds each status request open
+      // (up to 10s) and answers as soon as the browser sign-in finishes.
+      const timeout = Duration(seconds: 30);
+      final stopwatch = Stopwatch()..start();
+      debugPrint('DEBUG: Waiting for auth completion of session: $session_id');
 
+      for (var i = 0; stopwatch.elapsed < timeout; i++) {
         if (!mounted) {
           debugPrint('DEBUG: Polling stopped - widget not mounted');
           return;
         }
 
         try {
-          // Poll the backend
-          final result = await authService.getGoogleAuthStatus(session_id);
-          debugPrint(
-            'DEBUG: Polling attempt ${i + 1}/$maxAttempts for $session_id: $result',
+          final result = await authService.getGoogleAuthStatus(
+            session_id,
+            wait: 10,
           );
+          debugPrint('DEBUG: Status attempt ${i + 1} for $session_id: $result');
+
+          if (result == null) {
+            // Request failed; back off instead of retrying in a tight loop
+            await Future.delayed(const Duration(seconds: 1));
+            continue;
+          }
 
           if (result != null && result['status'] == 'success') {
             debugPrint('DEBUG: Auth Success detected for $session_id');
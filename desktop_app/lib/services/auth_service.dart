@@ -314,10 +314,14 @@ class AuthService extends ChangeNotifier {
     }
   }
 
-  Future<Map<String, dynamic>?> getGoogleAuthStatus(String sessionId) async {
+  /// With [wait] (seconds) the server holds the request until sign-in completes
+  Future<Map<String, dynamic>?> getGoogleAuthStatus(
+    String sessionId, {
+    int wait = 0,
+  }) async {
     try {
       final url = Uri.parse(
-        '$baseUrl/api/owners/google/status?session_id=$sessionId',
+        '$baseUrl/api/owners/google/status?session_id=$sessionId&wait=$wait',
       );
       final response = await http.get(url);
 